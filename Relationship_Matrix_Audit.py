@@ -1,81 +1,167 @@
-import sqlite3
+import argparse
+import sys
 import pandas as pd
 from pathlib import Path
 
-def audit_dob_normalization():
-	root = Path(__file__).resolve().parent
-	db_path = root / "output" / "warehouse.db"
-	conn = sqlite3.connect(db_path)
-
-	# Query to check unique date formats and their normalized results
-	query = """
-    SELECT 
-        source_vendor,
-        dob_raw,
-        dob_norm,
-        COUNT(*) as record_count
-    FROM silver_members
-    GROUP BY source_vendor, dob_raw, dob_norm
-    ORDER BY source_vendor, record_count DESC;
+# Make the pipeline package importable when this script is run from the project root
+SRC = Path(__file__).resolve().parent / "src"
+if str(SRC) not in sys.path:
+	sys.path.insert(0, str(SRC))
+
+from pipeline.db import shared_ro
+
+# Both audit matrices come back in a single round-trip; 'kind' tells them apart.
+# For DOB, only the top 3 parsed formats per vendor plus every unparsed one leave SQLite.
+# Rows arrive grouped by (kind, vendor) so each vendor block can be printed as soon as it ends.
+# failure_count (unparsed DOB formats per vendor) is computed in SQL and repeated on each row.
+AUDIT_MATRIX_QUERY = """
+    WITH dob_agg AS (
+        SELECT
+            source_vendor, dob_raw, dob_norm, COUNT(*) AS record_count,
+            SUM(CASE WHEN dob_norm IS NULL THEN 1 ELSE 0 END)
+                OVER (PARTITION BY source_vendor) AS failure_count
+        FROM silver_members
+        GROUP BY source_vendor, dob_raw, dob_norm
+    ),
+    dob_ranked AS (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY source_vendor ORDER BY record_count DESC) AS rn
+        FROM dob_agg
+        WHERE dob_norm IS NOT NULL
+    )
+    SELECT * FROM (
+        SELECT
+            'dob' AS kind, source_vendor, dob_raw AS raw_value, dob_norm AS norm_value,
+            record_count, failure_count
+        FROM dob_ranked
+        WHERE rn <= 3
+        UNION ALL
+        SELECT 'dob' AS kind, source_vendor, dob_raw, dob_norm, record_count, failure_count
+        FROM dob_agg
+        WHERE dob_norm IS NULL
+        UNION ALL
+        SELECT
+            'rel' AS kind,
+            source_vendor,
+            relationship_raw,
+            relationship_norm,
+            COUNT(*) as record_count,
+            0 AS failure_count
+        FROM silver_members
+        GROUP BY source_vendor, relationship_raw, relationship_norm
+    )
+    ORDER BY kind DESC, source_vendor, norm_value IS NULL, record_count DESC;
     """
 
-	df = pd.read_sql(query, conn)
-	conn.close()
 
-	print("\n" + "=" * 85)
-	print("DEEP AUDIT: DATE OF BIRTH (DOB) NORMALIZATION MATRIX")
-	print("=" * 85)
+FETCH_BATCH_SIZE = 10_000
+
+# Printable columns per kind; blocks are built with these names so no per-block rename/select copy
+AUDIT_COLUMNS = {
+	'rel': ['relationship_raw', 'relationship_norm', 'record_count'],
+	'dob': ['dob_raw', 'dob_norm', 'record_count'],
+}
+
+AUDIT_BANNERS = {
+	'rel': (80, "DEEP AUDIT: FULL RELATIONSHIP MAPPING MATRIX PER VENDOR"),
+	'dob': (85, "DEEP AUDIT: DATE OF BIRTH (DOB) NORMALIZATION MATRIX"),
+}
+
+
+def iter_vendor_blocks(conn, batch_size: int = FETCH_BATCH_SIZE):
+	"""
+	Streams the audit matrix and yields (kind, vendor, block_df, failure_count) per vendor block.
+	Only the block being assembled is buffered, never the full result set.
+	"""
+	cur = conn.execute(AUDIT_MATRIX_QUERY)
+
+	def _block(key, rows):
+		kind, vendor, failure_count = key
+		return kind, vendor, pd.DataFrame(rows, columns=AUDIT_COLUMNS[kind]), failure_count
+
+	current_key, buffer = None, []
+	while True:
+		rows = cur.fetchmany(batch_size)
+		if not rows:
+			break
+		for row in rows:
+			key = (row[0], row[1], row[5])
+			if key != current_key and buffer:
+				yield _block(current_key, buffer)
+				buffer = []
+			current_key = key
+			buffer.append(row[2:5])
+
+	if buffer:
+		yield _block(current_key, buffer)
+
 
-	for vendor in df['source_vendor'].unique():
-		print(f"\n[ Vendor: {vendor.upper()} ]")
-		vendor_df = df[df['source_vendor'] == vendor].copy()
+def _print_block(vendor_df: pd.DataFrame):
+	"""
+	Aligned table for a terminal; tab-separated (C writer, no width scan) when piped, e.g. in CI.
+	"""
+	if sys.stdout.isatty():
+		print(vendor_df.to_string(index=False))
+	else:
+		vendor_df.to_csv(sys.stdout, sep='\t', index=False)
 
-		# We show a sample of successes and all failures (NULLs)
-		success_sample = vendor_df[vendor_df['dob_norm'].notnull()].head(3)
-		failure_sample = vendor_df[vendor_df['dob_norm'].isnull()]
 
-		combined = pd.concat([success_sample, failure_sample])
-		print(combined[['dob_raw', 'dob_norm', 'record_count']].to_string(index=False))
+def _print_rule(width: int):
+	if sys.stdout.isatty():
+		print("-" * width)
 
-		if not failure_sample.empty:
-			print(f"!!! ALERT: Found {len(failure_sample)} unparsed date formats for this vendor.")
-		print("-" * 45)
+
+def audit_dob_normalization(vendor: str, vendor_df: pd.DataFrame, failure_count: int):
+	print(f"\n[ Vendor: {vendor.upper()} ]")
+
+	# SQL already trimmed this block to a sample of successes and all failures (NULLs)
+	_print_block(vendor_df)
+
+	if failure_count:
+		print(f"!!! ALERT: Found {failure_count} unparsed date formats for this vendor.")
+	_print_rule(45)
 
 
 ###################
-def audit_relationship_mapping():
-	# Setup paths
-	root = Path(__file__).resolve().parent
-	db_path = root / "output" / "warehouse.db"
-	conn = sqlite3.connect(db_path)
-
-	# Query to see EVERY unique mapping per vendor
-	query = """
-    SELECT 
-        source_vendor,
-        relationship_raw,
-        relationship_norm,
-        COUNT(*) as record_count
-    FROM silver_members
-    GROUP BY source_vendor, relationship_raw, relationship_norm
-    ORDER BY source_vendor, record_count DESC;
-    """
+def audit_relationship_mapping(vendor: str, vendor_df: pd.DataFrame, failure_count: int = 0):
+	print(f"\n[ Vendor: {vendor.upper()} ]")
+	_print_block(vendor_df)
+	_print_rule(40)
+
 
-	df = pd.read_sql(query, conn)
-	conn.close()
+AUDIT_PRINTERS = {
+	'rel': audit_relationship_mapping,
+	'dob': audit_dob_normalization,
+}
 
-	print("\n" + "=" * 80)
-	print("DEEP AUDIT: FULL RELATIONSHIP MAPPING MATRIX PER VENDOR")
-	print("=" * 80)
 
-	# Iterate by vendor for better readability
-	for vendor in df['source_vendor'].unique():
-		print(f"\n[ Vendor: {vendor.upper()} ]")
-		vendor_df = df[df['source_vendor'] == vendor].copy()
-		print(vendor_df[['relationship_raw', 'relationship_norm', 'record_count']].to_string(index=False))
-		print("-" * 40)
+def run_matrix_audit(as_json: bool = False):
+	"""
+	Runs both audits over the shared read-only connection, printing vendor by vendor.
+	With as_json, every block is emitted as JSON Lines records instead of a report.
+	"""
+	root = Path(__file__).resolve().parent
+	db_path = root / "output" / "warehouse.db"
+	conn = shared_ro(db_path)
+
+	current_kind = None
+	interactive = sys.stdout.isatty()
+	for kind, vendor, vendor_df, failure_count in iter_vendor_blocks(conn):
+		if as_json:
+			sys.stdout.write(
+				vendor_df.assign(kind=kind, source_vendor=vendor).to_json(orient='records', lines=True)
+			)
+			continue
+		if kind != current_kind and interactive:
+			width, title = AUDIT_BANNERS[kind]
+			print("\n" + "=" * width)
+			print(title)
+			print("=" * width)
+			current_kind = kind
+		AUDIT_PRINTERS[kind](vendor, vendor_df, failure_count)
 
 
 if __name__ == "__main__":
-	audit_relationship_mapping()
-	audit_dob_normalization()
+	parser = argparse.ArgumentParser(description="Relationship and DOB normalization audit.")
+	parser.add_argument("--json", action="store_true", help="emit machine-readable JSON Lines")
+	args = parser.parse_args()
+	run_matrix_audit(as_json=args.json)
@@ -1,26 +1,19 @@
-import sqlite3
-import pandas as pd
+import sys
+from datetime import datetime
 from pathlib import Path
-import sqlite3
-import json
 
+# Make the pipeline package importable when this script is run from the project root
+SRC = Path(__file__).resolve().parent / "src"
+if str(SRC) not in sys.path:
+	sys.path.insert(0, str(SRC))
 
+from pipeline.db import shared_ro
 
-def run_full_audit():
-	db_path = Path("output/warehouse.db")
-	if not db_path.exists():
-		print("Database not found!")
-		return
-
-	conn = sqlite3.connect(db_path)
-
-	print("=" * 60)
-	print(f"PIPELINE DATA AUDIT REPORT - {pd.Timestamp.now()}")
-	print("=" * 60)
+# Report queries are module-level constants; the sqlite3 statement cache is keyed on the SQL
+# text, so every call reuses the prepared statement instead of re-parsing it
 
-	# --- TEST 1: RAW STAGING INTEGRITY ---
-	print("\n[TEST 1] RAW STAGING: Missing Fields per Vendor")
-	raw_query = """
+# --- TEST 1: RAW STAGING INTEGRITY ---
+RAW_QUERY = """
     SELECT 
         source_vendor,
         COUNT(*) AS total,
@@ -30,11 +23,9 @@ def run_full_audit():
     FROM raw_staging
     GROUP BY 1
     """
-	print(pd.read_sql(raw_query, conn))
 
-	# --- TEST 2: SILVER NORMALIZATION SUCCESS ---
-	print("\n[TEST 2] SILVER LAYER: Normalization Success Rate")
-	silver_query = """
+# --- TEST 2: SILVER NORMALIZATION SUCCESS ---
+SILVER_QUERY = """
     SELECT 
         source_vendor,
         COUNT(*) AS total,
@@ -47,11 +38,9 @@ def run_full_audit():
     FROM silver_members
     GROUP BY 1
     """
-	print(pd.read_sql(silver_query, conn))
 
-	# --- TEST 3: END-TO-END TRACING (SPOT CHECK) ---
-	print("\n[TEST 3] SPOT CHECK: Random Trace (One per Vendor)")
-	trace_query = """
+# --- TEST 3: END-TO-END TRACING (SPOT CHECK) ---
+TRACE_QUERY = """
     SELECT 
         source_vendor,
         first_name_raw, first_name_norm,
@@ -60,38 +49,84 @@ def run_full_audit():
     FROM silver_members
     GROUP BY source_vendor
     """
-	print(pd.read_sql(trace_query, conn))
-	import sqlite3
-	import json
 
-	def verify_medical_c_extraction():
-		conn = sqlite3.connect("output/warehouse.db")
-		cursor = conn.cursor()
+# --- TEST 4: MEDICAL C NESTED JSON EXTRACTION ---
+MEDICAL_C_TRACE_QUERY = """
+    SELECT
+        json_extract(p.raw_payload_json, '$.name.first') AS original_name,
+        s.first_name_raw AS extracted_name,
+        CASE WHEN json_extract(p.raw_payload_json, '$.name.first') = s.first_name_raw
+             THEN '✅ SUCCESS' ELSE '❌ FAILED' END AS status
+    FROM raw_staging s
+    JOIN raw_staging_payload p USING (record_hash_raw)
+    WHERE s.source_vendor = 'medical_provider_c'
+    LIMIT 5
+    """
+
+
+def _run_and_print(cur, sql, params=()):
+	"""
+	Runs a report query on a raw cursor and prints it as a fixed-width table.
+	Rows are pulled in arraysize batches; no DataFrame is built for print-only output.
+	"""
+	cur.execute(sql, params)
+	cols = [d[0] for d in cur.description]
+	rows = []
+	while True:
+		batch = cur.fetchmany()
+		if not batch:
+			break
+		rows.extend(tuple(str(v) for v in row) for row in batch)
 
-		query = """
-	    SELECT p.raw_payload_json, s.first_name_raw, s.address_line1, s.dob_raw
-	    FROM raw_staging s
-	    JOIN raw_staging_payload p ON s.record_hash_raw = p.record_hash_raw
-	    WHERE s.source_vendor = 'medical_provider_c'
-	    LIMIT 5
-	    """
+	widths = [max([len(col)] + [len(row[i]) for row in rows]) for i, col in enumerate(cols)]
+	print("  ".join(col.ljust(w) for col, w in zip(cols, widths)).rstrip())
+	for row in rows:
+		print("  ".join(val.ljust(w) for val, w in zip(row, widths)).rstrip())
 
-		rows = cursor.execute(query).fetchall()
-		print(f"{'JSON Original Name':<25} | {'Extracted Name':<15} | {'Status'}")
-		print("-" * 55)
 
-		for payload_str, extracted_name, address, dob in rows:
-			payload = json.loads(payload_str)
-			original_name = payload.get('name', {}).get('first')
+def verify_medical_c_extraction(conn):
+	"""
+	Spot-checks that Medical C's nested name.first was flattened into first_name_raw.
+	The nested name is pulled out of the payload by SQLite's JSON1 functions,
+	so no per-row json.loads happens in Python.
+	"""
+	cursor = conn.cursor()
+	cursor.arraysize = 5
 
-			status = "✅ SUCCESS" if original_name == extracted_name else "❌ FAILED"
-			print(f"{str(original_name):<25} | {str(extracted_name):<15} | {status}")
+	rows = cursor.execute(MEDICAL_C_TRACE_QUERY).fetchmany()
+	print(f"{'JSON Original Name':<25} | {'Extracted Name':<15} | {'Status'}")
+	print("-" * 55)
 
-		conn.close()
+	for original_name, extracted_name, status in rows:
+		print(f"{str(original_name):<25} | {str(extracted_name):<15} | {status}")
 
-	verify_medical_c_extraction()
 
-	conn.close()
+def run_full_audit():
+	db_path = Path("output/warehouse.db")
+	if not db_path.exists():
+		print("Database not found!")
+		return
+
+	conn = shared_ro(db_path.resolve())
+	cur = conn.cursor()
+	cur.arraysize = 1000
+
+	print("=" * 60)
+	print(f"PIPELINE DATA AUDIT REPORT - {datetime.now()}")
+	print("=" * 60)
+
+	# --- TEST 1: RAW STAGING INTEGRITY ---
+	print("\n[TEST 1] RAW STAGING: Missing Fields per Vendor")
+	_run_and_print(cur, RAW_QUERY)
+
+	# --- TEST 2: SILVER NORMALIZATION SUCCESS ---
+	print("\n[TEST 2] SILVER LAYER: Normalization Success Rate")
+	_run_and_print(cur, SILVER_QUERY)
+
+	# --- TEST 3: END-TO-END TRACING (SPOT CHECK) ---
+	print("\n[TEST 3] SPOT CHECK: Random Trace (One per Vendor)")
+	_run_and_print(cur, TRACE_QUERY)
+	verify_medical_c_extraction(conn)
 
 
 if __name__ == "__main__":
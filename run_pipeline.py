@@ -1,5 +1,6 @@
 import logging
 from pathlib import Path
+from pipeline.db import get_conn
 from pipeline.main import main
 # We keep the import name, but ensure run_sql_checks.py now has Silver checks
 from run_sql_checks import run_validation
@@ -24,14 +25,16 @@ if __name__ == "__main__":
     try:
         logger.info("Starting Eligibility Pipeline Execution")
 
-        # Step 1: Execute core pipeline logic (Stage 0, 1, and now Stage 2)
-        # The main function now includes the call to stage2_clean_silver
-        load_run_id = main(root)
+        # One connection serves every stage and the validation step
+        with get_conn(root) as conn:
+            # Step 1: Execute core pipeline logic (Stage 0, 1, and now Stage 2)
+            # The main function now includes the call to stage2_clean_silver
+            load_run_id = main(root, conn=conn)
 
-        # Step 2: Automatic Data Quality Validation
-        # Now verifies both Stage 1 (Bronze) and Stage 2 (Silver)
-        logger.info("Running automated SQL integrity checks for Bronze and Silver layers...")
-        run_validation(root, load_run_id) # Added 'root' to pass the path
+            # Step 2: Automatic Data Quality Validation
+            # Now verifies both Stage 1 (Bronze) and Stage 2 (Silver)
+            logger.info("Running automated SQL integrity checks for Bronze and Silver layers...")
+            run_validation(root, load_run_id, conn=conn) # Added 'root' to pass the path
 
         logger.info("Pipeline run completed successfully. All layers validated.")
 
@@ -1,32 +1,39 @@
 import sqlite3
+import sys
 import logging
 from pathlib import Path
 
+# Make the pipeline package importable when this script is run from the project root
+SRC = Path(__file__).resolve().parent / "src"
+if str(SRC) not in sys.path:
+	sys.path.insert(0, str(SRC))
+
+from pipeline.db import open_ro
+
 # Setup logging configuration
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 logger = logging.getLogger(__name__)
 
 # --- Centralized SQL Queries ---
 QUERIES = {
-	# Fetch row counts from all three layers for the specific run
-	"counts_raw": "SELECT COUNT(*) FROM raw_staging WHERE load_run_id = ?;",
-	"counts_payload": "SELECT COUNT(*) FROM raw_staging_payload WHERE load_run_id = ?;",
-	"counts_silver": "SELECT COUNT(*) FROM silver_members WHERE load_run_id = ?;",
-
-	# Verify that every raw record has a corresponding JSON payload
-	"join_completeness": """
-        SELECT COUNT(*) FROM raw_staging s
-        JOIN raw_staging_payload p ON s.load_run_id = p.load_run_id
-         AND s.source_vendor = p.source_vendor AND s.source_file = p.source_file
-         AND s.source_row = p.source_row
-        WHERE s.load_run_id = ?;
+	# Row counts from all three layers plus the raw-to-payload lineage join, in one statement.
+	# Every scalar subquery binds the same :rid so the run ID is bound once.
+	"integrity_batch": """
+        SELECT
+            (SELECT COUNT(*) FROM raw_staging WHERE load_run_id = :rid) AS n_raw,
+            (SELECT COUNT(*) FROM raw_staging_payload WHERE load_run_id = :rid) AS n_payload,
+            (SELECT COUNT(*) FROM silver_members WHERE load_run_id = :rid) AS n_silver,
+            (SELECT COUNT(*) FROM raw_staging s
+             JOIN raw_staging_payload p
+             USING (load_run_id, source_vendor, source_file, source_row)
+             WHERE s.load_run_id = :rid) AS joined;
     """,
 
 	# Sample check to verify Stage 2 normalization (Raw value vs Standardized value)
 	"sample_silver": """
         SELECT source_vendor, first_name_raw, first_name_norm, relationship_raw, relationship_norm
         FROM silver_members 
-        WHERE load_run_id = ? 
+        WHERE load_run_id = :rid
         AND source_vendor = 'medical_provider_a'
         LIMIT 3;
     """
@@ -42,10 +49,11 @@ def get_latest_run_id(cur: sqlite3.Cursor) -> str:
 	return res[0] if res else None
 
 
-def run_validation(root: Path, load_run_id: str = None):
+def run_validation(root: Path, load_run_id: str = None, conn: sqlite3.Connection = None):
 	"""
 	Performs integrity checks on Bronze and Silver layers.
 	If load_run_id is not provided, it automatically discovers the latest run.
+	If conn is given (shared run connection) it is used and left open.
 	"""
 	db_path = root / "output" / "warehouse.db"
 
@@ -53,9 +61,12 @@ def run_validation(root: Path, load_run_id: str = None):
 		logger.error(f"Database not found at {db_path}")
 		return
 
-	conn = sqlite3.connect(db_path)
-	conn.row_factory = sqlite3.Row
+	owns_conn = conn is None
+	if owns_conn:
+		conn = open_ro(db_path)
 	cur = conn.cursor()
+	# Row access by name is set on the cursor so a shared connection is left untouched
+	cur.row_factory = sqlite3.Row
 
 	try:
 		# Step 1: Discover the latest Run ID if none was passed
@@ -68,20 +79,19 @@ def run_validation(root: Path, load_run_id: str = None):
 
 		logger.info(f"\n--- Integrity Report for Run: {load_run_id} ---")
 
-		# Step 2: Compare Row Counts across all layers
-		n_raw = cur.execute(QUERIES["counts_raw"], (load_run_id,)).fetchone()[0]
-		n_payload = cur.execute(QUERIES["counts_payload"], (load_run_id,)).fetchone()[0]
-		n_silver = cur.execute(QUERIES["counts_silver"], (load_run_id,)).fetchone()[0]
+		# Step 2: Compare Row Counts across all layers (single round-trip)
+		n_raw, n_payload, n_silver, joined = cur.execute(
+			QUERIES["integrity_batch"], {"rid": load_run_id}
+		).fetchone()
 
 		logger.info(f"Row Counts: Raw={n_raw}, Payload={n_payload}, Silver={n_silver}")
 
 		# Step 3: Verify Lineage (Bronze Layer Consistency)
-		joined = cur.execute(QUERIES["join_completeness"], (load_run_id,)).fetchone()[0]
 		logger.info(f"Lineage Check (Raw to Payload): {joined}/{n_raw}")
 
 		# Step 4: Validate Normalization Results (Silver Layer)
 		logger.info("\n--- Stage 2 Normalization Sample (Raw vs. Norm) ---")
-		samples = cur.execute(QUERIES["sample_silver"], (load_run_id,)).fetchall()
+		samples = cur.execute(QUERIES["sample_silver"], {"rid": load_run_id}).fetchall()
 
 		for row in samples:
 			logger.info(
@@ -90,7 +100,8 @@ def run_validation(root: Path, load_run_id: str = None):
 			)
 
 	finally:
-		conn.close()
+		if owns_conn:
+			conn.close()
 
 
 if __name__ == "__main__":
@@ -48,6 +48,11 @@ CREATE TABLE IF NOT EXISTS raw_staging (
 );
 
 -- Recommended indexes (optional, but helpful)
+-- Lineage key shared with raw_staging_payload's primary key; serves run-scoped lookups
+-- and the raw <-> payload join used by the SQL checks
+CREATE INDEX IF NOT EXISTS idx_raw_staging_lineage
+  ON raw_staging (load_run_id, source_vendor, source_file, source_row);
+
 CREATE INDEX IF NOT EXISTS idx_raw_staging_vendor
   ON raw_staging (source_vendor);
 
@@ -29,4 +29,12 @@ CREATE TABLE IF NOT EXISTS silver_members (
     ingested_at TEXT,
     cleaned_at TEXT,
     PRIMARY KEY (load_run_id, source_vendor, source_row)
-);
\ No newline at end of file
+);
+
+-- Covering indexes for the normalization audits (GROUP BY vendor, raw, norm),
+-- so the matrices are built from index scans without a temp sort
+CREATE INDEX IF NOT EXISTS idx_silver_members_dob_audit
+  ON silver_members (source_vendor, dob_raw, dob_norm);
+
+CREATE INDEX IF NOT EXISTS idx_silver_members_relationship_audit
+  ON silver_members (source_vendor, relationship_raw, relationship_norm);
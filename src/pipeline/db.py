@@ -0,0 +1,112 @@
+import atexit
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator
+import sqlite3
+
+# Persistent settings: stored in the DB file, applied once by init_db.
+# page_size must be set before the first table is created (and before WAL is enabled).
+DB_CREATE_PRAGMAS = [
+    "PRAGMA page_size=8192;",
+    "PRAGMA journal_mode=WAL;",
+]
+
+# Per-connection settings: SQLite forgets these on close, so every open re-applies them.
+CONNECTION_PRAGMAS = [
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA cache_size=-131072;",
+]
+
+# Bulk-ingest overrides, active only while Stage 1 loads raw files. Durability is left at
+# synchronous=NORMAL: raw_staging accumulates across load runs and shares the file with
+# silver_members, so an fsync skipped here could corrupt the whole warehouse, and under WAL
+# NORMAL already only syncs at checkpoints. The load just gets a wider page cache.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA cache_size=-262144;",
+]
+
+# Prepared statements kept per connection (sqlite3 default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+
+def open_conn(db_path: Path, **connect_kwargs) -> sqlite3.Connection:
+    """
+    Opens a connection to the warehouse with the pipeline's tuned PRAGMAs.
+    Extra keyword arguments are passed straight to sqlite3.connect.
+    """
+    connect_kwargs.setdefault("cached_statements", STATEMENT_CACHE_SIZE)
+    conn = sqlite3.connect(db_path, **connect_kwargs)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def open_ro(db_path: Path, **connect_kwargs) -> sqlite3.Connection:
+    """
+    Opens a read-only connection for audits and checks.
+    The file is opened with mode=ro and query_only is set, so the handle never
+    asks for a write lock and can read alongside the pipeline's WAL writer.
+    The path is percent-encoded into the URI, so '#', '?' and '%' in it stay part of the file name.
+    """
+    conn = open_conn(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, **connect_kwargs)
+    conn.execute("PRAGMA query_only=1;")
+    return conn
+
+
+@lru_cache(maxsize=None)
+def shared_ro(db_path: Path) -> sqlite3.Connection:
+    """
+    Returns the process-wide read-only connection for db_path, opening it on first use.
+    Audits run back to back reuse it instead of reopening the file; it is closed at exit.
+    """
+    conn = open_ro(db_path)
+    atexit.register(conn.close)
+    return conn
+
+
+@contextmanager
+def bulk_load(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    Runs the block as one BEGIN IMMEDIATE write transaction under BULK_LOAD_PRAGMAS.
+    Commits on success and rolls back on error, and only then restores CONNECTION_PRAGMAS,
+    so a shared run connection goes back to its normal settings for later stages
+    and the block's own exception is the one that propagates.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    for pragma in BULK_LOAD_PRAGMAS:
+        conn.execute(pragma)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+
+
+@contextmanager
+def get_conn(root: Path) -> Iterator[sqlite3.Connection]:
+    """
+    Yields a single warehouse connection shared by every stage of one pipeline run.
+    Commits when the block succeeds, rolls back on error, and always closes.
+    """
+    output_dir = root / "output"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    conn = open_conn(output_dir / "warehouse.db")
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
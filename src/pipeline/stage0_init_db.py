@@ -1,9 +1,52 @@
 from pathlib import Path
+import hashlib
 import sqlite3
+from pipeline.db import DB_CREATE_PRAGMAS, open_conn
 
-def init_db(root: Path) -> Path:
+# Tables every initialized warehouse must contain
+EXPECTED_TABLES = ("raw_staging", "raw_staging_payload", "silver_members")
+
+
+def schema_version(ddl_scripts: list[bytes]) -> int:
+    """
+    Fingerprints the DDL scripts as a positive 31-bit int that fits PRAGMA user_version.
+    """
+    digest = hashlib.blake2b(b"".join(ddl_scripts), digest_size=4).digest()
+    return (int.from_bytes(digest, "big") & 0x7FFFFFFF) or 1
+
+
+def _apply_ddl(conn: sqlite3.Connection, ddl_scripts: list[bytes], version: int) -> None:
+    """
+    Runs the DDL scripts and stamps the schema fingerprint into user_version.
+    """
+    cur = conn.cursor()
+    # Storage layout + WAL are persisted in the file, so they only need setting here
+    for pragma in DB_CREATE_PRAGMAS:
+        cur.execute(pragma)
+
+    for ddl_script in ddl_scripts:
+        cur.executescript(ddl_script.decode("utf-8"))
+
+    cur.execute(f"PRAGMA user_version = {version};")
+    conn.commit()
+
+
+def _missing_tables(conn: sqlite3.Connection) -> list[str]:
+    """
+    Returns the EXPECTED_TABLES absent from the database (one sqlite_master probe for all tables).
+    """
+    cur = conn.execute(
+        f"SELECT name FROM sqlite_master WHERE type='table' AND name IN ({', '.join('?' * len(EXPECTED_TABLES))});",
+        EXPECTED_TABLES,
+    )
+    found_tables = {row[0] for row in cur.fetchall()}
+    return [table for table in EXPECTED_TABLES if table not in found_tables]
+
+
+def init_db(root: Path, conn: sqlite3.Connection | None = None) -> Path:
     """
     Stage 1: Create a local SQLite warehouse and initialize RAW STAGING tables.
+    If conn is given (shared run connection) it is used and left open.
     """
 
     # 1) Build project paths from the project root
@@ -20,30 +63,34 @@ def init_db(root: Path) -> Path:
     # 2) Ensure output/ exists
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # 3) Connect to SQLite (creates the DB file if it does not exist)
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-
-    # 4) Load and run the DDL scripts
+    # 3) Load the DDL scripts and fingerprint them
+    ddl_scripts = []
     for ddl_path in ddl_paths:
         if not ddl_path.exists():
             raise FileNotFoundError(f"Missing DDL script: {ddl_path}")
-        ddl_sql = ddl_path.read_text(encoding="utf-8")
-        cur.executescript(ddl_sql)
-
-    conn.commit()
+        ddl_scripts.append(ddl_path.read_bytes())
+    version = schema_version(ddl_scripts)
 
-    # 5) Consolidated Verification
-    def _table_exists(cursor: sqlite3.Cursor, table_name: str) -> bool:
-        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?;", (table_name,))
-        return cursor.fetchone() is not None
+    # 4) Connect to SQLite (creates the DB file if it does not exist)
+    owns_conn = conn is None
+    if owns_conn:
+        conn = open_conn(db_path)
 
-    missing_tables = []
-    for table in ["raw_staging", "raw_staging_payload"]:
-        if not _table_exists(cur, table):
-            missing_tables.append(table)
+    try:
+        # 5) Run the DDL only when the DB was built from different scripts (or not at all)
+        ddl_applied = conn.execute("PRAGMA user_version;").fetchone()[0] != version
+        if ddl_applied:
+            _apply_ddl(conn, ddl_scripts, version)
 
-    conn.close()
+        # 6) Consolidated Verification; a current fingerprint with a table dropped since
+        #    gets the DDL re-run once to repair it, as a cold init would
+        missing_tables = _missing_tables(conn)
+        if missing_tables and not ddl_applied:
+            _apply_ddl(conn, ddl_scripts, version)
+            missing_tables = _missing_tables(conn)
+    finally:
+        if owns_conn:
+            conn.close()
 
     if missing_tables:
         raise RuntimeError(f"The following tables were not created: {', '.join(missing_tables)}")
@@ -3,16 +3,34 @@ from __future__ import annotations
 import csv
 import hashlib
 import json
-import sqlite3
 import logging
-from dataclasses import dataclass, asdict
+import mmap
+import os
+import re
+import secrets
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
-from uuid import uuid4
+from xml.etree import ElementTree
 
 from openpyxl import load_workbook
 
+try:
+    # Optional Rust-backed Excel reader; openpyxl stays the fallback when it is not installed
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    # Optional fast JSON encoder for the manifest; stdlib json is the fallback
+    import orjson
+except ImportError:
+    orjson = None
+
 # Setup logging configuration
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 logger = logging.getLogger(__name__)
@@ -34,6 +52,7 @@ EXPECTED_INPUTS = [
         "format": "csv",
         "delimiter": ",",
         "has_header": True,
+        "quoted_multiline": False,
     },
     {
         "source_vendor": "medical_a",
@@ -41,6 +60,7 @@ EXPECTED_INPUTS = [
         "format": "csv",
         "delimiter": ",",
         "has_header": True,
+        "quoted_multiline": False,
     },
     {
         "source_vendor": "medical_b",
@@ -48,6 +68,7 @@ EXPECTED_INPUTS = [
         "format": "txt",
         "delimiter": "|",
         "has_header": True,
+        "quoted_multiline": False,
     },
     {
         "source_vendor": "medical_c",
@@ -86,31 +107,150 @@ def _utc_now_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 def generate_load_run_id() -> str:
-    """Generate a unique load_run_id for each pipeline run."""
-    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-    return f"{ts}_{uuid4().hex[:8]}"
+    """Generate a unique load_run_id for each pipeline run (e.g. 20251231T170615Z_5947ddfa)."""
+    ts = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    return f"{ts}_{secrets.token_hex(4)}"
 
-def compute_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
-    """Compute SHA256 checksum for a file in a streaming manner."""
+def compute_sha256(path: Path, chunk_size: int = 4 * 1024 * 1024) -> str:
+    """
+    Compute SHA256 checksum for a file in a streaming manner.
+    hashlib.sha256 is OpenSSL-backed (SHA-NI where the CPU has it); chunks are read
+    into one preallocated buffer so no bytes object is allocated per chunk.
+    """
     h = hashlib.sha256()
-    with path.open("rb") as f:
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with path.open("rb", buffering=0) as f:
         while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
+            n = f.readinto(buf)
+            if not n:
                 break
-            h.update(chunk)
+            h.update(view[:n])
     return h.hexdigest()
 
-def file_modified_time_utc(path: Path) -> str:
-    """Return file modified time as UTC ISO timestamp."""
-    mtime = path.stat().st_mtime
+def file_modified_time_utc(mtime: float) -> str:
+    """Return a file's st_mtime as UTC ISO timestamp (the caller's stat result is reused)."""
     return datetime.fromtimestamp(mtime, tz=timezone.utc).replace(microsecond=0).isoformat()
 
+# -----------------------------
+# Helpers: Checksum Cache
+# -----------------------------
+# Sidecar cache of checksums, keyed by absolute path and valid while (size, mtime_ns) match
+HASH_CACHE_FILE = ".hash_cache.json"
+
+def load_hash_cache(cache_path: Path) -> dict[str, dict[str, Any]]:
+    """Load the checksum cache; a missing or unreadable cache starts empty."""
+    try:
+        return json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def save_hash_cache(cache_path: Path, cache: dict[str, dict[str, Any]]) -> None:
+    """Rewrite the checksum cache atomically (temp file + os.replace)."""
+    tmp_path = cache_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+    os.replace(tmp_path, cache_path)
+
+def cached_sha256(path: Path, st: os.stat_result, cache: dict[str, dict[str, Any]]) -> str | None:
+    """Return the cached checksum if the file's size and mtime_ns are unchanged, else None."""
+    entry = cache.get(os.path.abspath(path))
+    if entry and entry["size_bytes"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+        return entry["sha256"]
+    return None
+
+def remember_sha256(path: Path, st: os.stat_result, sha: str, cache: dict[str, dict[str, Any]]) -> None:
+    """Record a freshly computed checksum against the file's current size and mtime_ns."""
+    cache[os.path.abspath(path)] = {"size_bytes": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha}
+
+def compute_sha256_cached(path: Path, cache: dict[str, dict[str, Any]], st: os.stat_result | None = None) -> str:
+    """compute_sha256, skipped when the cache holds a checksum for the unchanged file."""
+    st = st or os.stat(path)
+    sha = cached_sha256(path, st, cache)
+    if sha is None:
+        sha = compute_sha256(path)
+        remember_sha256(path, st, sha, cache)
+    return sha
+
+# -----------------------------
+# Helpers: Byte-Level Line Counting
+# -----------------------------
+# Lines csv.reader turns into an empty row; the CSV row counters skip them. Lines after the first
+# are matched from their leading newline: a literal first byte lets re skip ahead to each newline
+# instead of trying a ^-anchored MULTILINE match at every byte.
+_BLANK_CSV_FIRST_LINE = re.compile(rb"\r?(?=\n|\Z)")
+_BLANK_CSV_LINE = re.compile(rb"\n\r?(?=\n|\Z)")
+_BARE_CR = re.compile(rb"\r(?!\n)")
+
+# JSONL blankness follows str.strip() on the decoded line. bytes.strip() covers ASCII whitespace;
+# only what is left starting with a byte that can open another str.isspace() character
+# (\x1c-\x1f, or the UTF-8 lead byte of U+0085, U+3000, ...) needs decoding. U+3000 is the
+# highest such code point. A BOM is not whitespace, as with strip().
+_UNICODE_SPACE_LEAD = frozenset(
+    chr(c).encode("utf-8")[0] for c in range(0x3001)
+    if chr(c).isspace() and not chr(c).encode("utf-8").isspace()
+)
+
+# Window for newline counting: mmap has no count(), so it is counted slice by slice
+_SCAN_WINDOW = 4 * 1024 * 1024
+
+def _has_bare_cr(buf: bytes | mmap.mmap) -> bool:
+    """True when buf holds a CR not followed by LF (memchr for any CR first; the regex only runs if one exists)."""
+    return buf.find(b"\r") != -1 and _BARE_CR.search(buf) is not None
+
+def _count_newlines(buf: bytes | mmap.mmap) -> int:
+    """Count newlines in buf one window at a time (no full copy of a mapped file)."""
+    return sum(buf[i:i + _SCAN_WINDOW].count(b"\n") for i in range(0, len(buf), _SCAN_WINDOW))
+
+def _is_blank_jsonl_line(line: bytes) -> bool:
+    """True when the decoded line would be empty after str.strip()."""
+    stripped = line.strip()
+    return not stripped or (stripped[0] in _UNICODE_SPACE_LEAD and not stripped.decode("utf-8").strip())
+
+def _count_jsonl_lines(mm: mmap.mmap) -> int:
+    """
+    Count non-blank JSON Lines, reading the mapping one line at a time with mmap.readline.
+    A byte-level newline count plus a blank-line regex costs several passes over the buffer;
+    one C-level readline per line stays cheaper than the text-mode loop it replaces.
+    """
+    mm.seek(0)
+    return sum(1 for line in iter(mm.readline, b"") if not _is_blank_jsonl_line(line))
+
+def _count_data_lines(buf: bytes | mmap.mmap, has_header: bool) -> int:
+    """
+    Count non-blank CSV lines (newline count minus blank lines), minus the header line.
+    Mirrors the csv.reader counter: a blank first line is skipped, not taken as the header.
+    """
+    if len(buf) == 0:
+        return 0
+
+    ends_with_newline = buf[-1:] == b"\n"
+    lines = _count_newlines(buf) + (0 if ends_with_newline else 1)
+    first_is_blank = _BLANK_CSV_FIRST_LINE.match(buf) is not None
+    # A trailing newline also matches as an empty later line; it is not a line
+    blanks = first_is_blank + sum(1 for _ in _BLANK_CSV_LINE.finditer(buf)) - ends_with_newline
+    rows = lines - blanks
+
+    if has_header and not first_is_blank:
+        rows -= 1
+    return rows
+
 # -----------------------------
 # Helpers: Row Counting Logic
 # -----------------------------
-def count_rows_csv_like(path: Path, delimiter: str, has_header: bool = True) -> int:
-    """Count rows in CSV/TXT files. Header is excluded if has_header=True."""
+def count_rows_csv_like(path: Path, delimiter: str, has_header: bool = True, quoted_multiline: bool = True) -> int:
+    """
+    Count rows in CSV/TXT files. Header is excluded if has_header=True.
+    Files declared without quoted multi-line fields are counted by newline scan over an mmap;
+    otherwise (or on bare CR line endings) csv.reader tokenizes the file.
+    """
+    if not quoted_multiline:
+        with path.open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if not _has_bare_cr(mm):
+                    return _count_data_lines(mm, has_header)
+
     with path.open("r", encoding="utf-8-sig", newline="") as f:
         reader = csv.reader(f, delimiter=delimiter)
         count = 0
@@ -123,7 +263,17 @@ def count_rows_csv_like(path: Path, delimiter: str, has_header: bool = True) ->
     return count
 
 def count_rows_jsonl(path: Path) -> int:
-    """Count non-empty JSON Lines."""
+    """
+    Count non-empty JSON Lines.
+    Counted line by line over an mmap; bare CR line endings (split by text mode) use the text line loop.
+    """
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if not _has_bare_cr(mm):
+                return _count_jsonl_lines(mm)
+
     count = 0
     with path.open("r", encoding="utf-8") as f:
         for line in f:
@@ -131,13 +281,46 @@ def count_rows_jsonl(path: Path) -> int:
                 count += 1
     return count
 
+def _is_data_row(row) -> bool:
+    """An Excel row counts when any cell holds a non-blank value."""
+    return any(v is not None and str(v).strip() != "" for v in row)
+
+_XLSX_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+def _xlsx_active_sheet_index(path: Path) -> int:
+    """
+    Index of the workbook's active sheet, resolved as openpyxl's wb.active does:
+    the first workbookView carrying activeTab, else the first sheet.
+    """
+    with zipfile.ZipFile(path) as zf:
+        root = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    for view in root.iter(f"{_XLSX_MAIN_NS}workbookView"):
+        if view.get("activeTab") is not None:
+            return int(view.get("activeTab"))
+    return 0
+
 def count_rows_xlsx(path: Path, sheet_name: str | None = None) -> int:
-    """Count data rows in Excel, assuming row 1 is header."""
+    """
+    Count data rows in Excel, assuming row 1 is header.
+    Uses python-calamine when available (no per-cell XML parsing in Python), else openpyxl read-only.
+    """
+    if CalamineWorkbook is not None:
+        wb = CalamineWorkbook.from_path(str(path))
+        if sheet_name and sheet_name in wb.sheet_names:
+            sheet = wb.get_sheet_by_name(sheet_name)
+        else:
+            sheet = wb.get_sheet_by_index(_xlsx_active_sheet_index(path))
+        # iter_rows starts at the first used row; only skip it when that row is row 1 (the header)
+        rows = sheet.iter_rows()
+        if sheet.start is not None and sheet.start[0] == 0:
+            next(rows, None)
+        return sum(1 for row in rows if _is_data_row(row))
+
     wb = load_workbook(filename=path, read_only=True, data_only=True)
     ws = wb[sheet_name] if sheet_name and sheet_name in wb.sheetnames else wb.active
     count = 0
     for row in ws.iter_rows(min_row=2, values_only=True):
-        if any(v is not None and str(v).strip() != "" for v in row):
+        if _is_data_row(row):
             count += 1
     wb.close()
     return count
@@ -149,6 +332,7 @@ def count_rows_by_format(path: Path, fmt: str, meta: dict[str, Any]) -> int:
             path=path,
             delimiter=meta.get("delimiter", ","),
             has_header=meta.get("has_header", True),
+            quoted_multiline=meta.get("quoted_multiline", True),
         )
     if fmt == "jsonl":
         return count_rows_jsonl(path)
@@ -156,58 +340,151 @@ def count_rows_by_format(path: Path, fmt: str, meta: dict[str, Any]) -> int:
         return count_rows_xlsx(path, sheet_name=meta.get("sheet_name"))
     raise ValueError(f"Unsupported format: {fmt}")
 
-# ----------------------------------------------------------
-# Database Initialization: The "Clean Slate" Strategy
-# ----------------------------------------------------------
-def init_db(root: Path):
+# -----------------------------
+# Helpers: Fused Single-Pass Scan
+# -----------------------------
+def count_rows_fast(buf: mmap.mmap, fmt: str, meta: dict[str, Any]) -> int | None:
     """
-    Initializes the SQLite database.
-    Drops existing tables to ensure a clean state for the new run.
+    Count data rows straight from the mapped file: CSV/TXT by C-level byte scans
+    (newline count minus blank lines), JSONL by mmap.readline.
+    Returns None when a byte count cannot match the parser (quotes in a file that may hold
+    quoted multi-line fields, bare CR endings).
     """
-    output_dir = root / "output"
-    sql_dir = root / "sql"
-    db_path = output_dir / "warehouse.db"
+    if fmt in ("csv", "txt"):
+        if meta.get("quoted_multiline", True) and buf.find(b'"') != -1:
+            return None
+        if _has_bare_cr(buf):
+            return None
+        return _count_data_lines(buf, meta.get("has_header", True))
+    if fmt == "jsonl":
+        if _has_bare_cr(buf):
+            return None
+        return _count_jsonl_lines(buf)
+    return None
 
-    output_dir.mkdir(parents=True, exist_ok=True)
+def scan_file(path: Path, fmt: str, meta: dict[str, Any]) -> tuple[str, int, int]:
+    """
+    Return (sha256, row_count, size_bytes) from a single mmap of the file.
+    The mapped bytes feed both the hash and the row count, so the file is read from disk once.
+    """
+    with path.open("rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return hashlib.sha256().hexdigest(), 0, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            sha = hashlib.sha256(mm).hexdigest()
+            rows = count_rows_fast(mm, fmt, meta)
 
-    # Establish connection
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-
-    # Drop existing tables to prevent data pollution from previous runs
-    tables_to_drop = ["silver_members", "raw_staging_payload", "raw_staging"]
-    for table in tables_to_drop:
-        cur.execute(f"DROP TABLE IF EXISTS {table}")
-        logger.info(f"Dropped table (if existed): {table}")
-
-    # Recreate tables using DDL scripts from the /sql folder
-    ddl_files = [
-        "01_create_raw_staging.sql",
-        "02_create_raw_staging_payload.sql",
-        "03_create_silver_members.sql"
-    ]
-
-    for ddl_file in ddl_files:
-        ddl_path = sql_dir / ddl_file
-        if ddl_path.exists():
-            with open(ddl_path, 'r') as f:
-                cur.executescript(f.read())
-            logger.info(f"Executed DDL: {ddl_file}")
-        else:
-            logger.warning(f"DDL script missing: {ddl_path}")
+    if rows is None:
+        rows = count_rows_by_format(path, fmt, meta)
+    return sha, rows, size
 
-    conn.commit()
-    conn.close()
-    logger.info(f"Database initialized and clean: {db_path}")
-    return db_path
+# -----------------------------
+# Helpers: Manifest Output
+# -----------------------------
+def _manifest_payload(manifest: StagingManifest) -> dict[str, Any]:
+    """Shallow dict view of the manifest (asdict would deep-copy every entry)."""
+    return {
+        "load_run_id": manifest.load_run_id,
+        "ingested_at_utc": manifest.ingested_at_utc,
+        "input_dir": manifest.input_dir,
+        "files": [dict(vars(entry)) for entry in manifest.files],
+    }
+
+def _dumps_manifest(payload: dict[str, Any]) -> bytes:
+    """Serialize the manifest as 2-space indented UTF-8 JSON (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+    return json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+
+def _publish_latest(manifest_path: Path, latest_path: Path, content: bytes) -> None:
+    """
+    Point latest_path at the run manifest via a hardlink swapped in with os.replace.
+    Falls back to writing the bytes where hardlinks are not supported.
+    """
+    tmp_path = latest_path.with_suffix(".tmp")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(manifest_path, tmp_path)
+    except OSError:
+        tmp_path.write_bytes(content)
+    os.replace(tmp_path, latest_path)
 
 # -----------------------------
 # Stage 0: Manifest Generation
 # -----------------------------
+def _process_spec(
+    root: Path,
+    spec: dict[str, Any],
+    require_non_empty: bool,
+    hash_cache: dict[str, dict[str, Any]],
+) -> ManifestFileEntry:
+    """
+    Collects metadata (size, mtime, checksum, row count) for one expected input file.
+    Failures are captured in the returned entry instead of raised.
+    """
+    vendor = spec["source_vendor"]
+    file_name = spec["file_name"]
+    fmt = spec["format"]
+    file_path = root / "input" / file_name
+
+    # One stat per file; size, mtime and checksum are computed once and reused by the failure entry
+    relative_path = f"input/{file_name}"
+    size, mtime, sha = 0, "", ""
+
+    try:
+        try:
+            st = os.stat(file_path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise FileNotFoundError(f"Missing expected input file: {file_path}") from None
+        relative_path = str(file_path.relative_to(root))
+
+        size = st.st_size
+        mtime = file_modified_time_utc(st.st_mtime)
+
+        # Collect checksum + row count (text formats: one pass over the file unless the checksum is cached)
+        if fmt in ("csv", "txt", "jsonl") and cached_sha256(file_path, st, hash_cache) is None:
+            sha, rows, _ = scan_file(file_path, fmt, spec)
+            remember_sha256(file_path, st, sha, hash_cache)
+        else:
+            sha = compute_sha256_cached(file_path, hash_cache, st)
+            rows = count_rows_by_format(file_path, fmt, spec)
+
+        if require_non_empty and rows == 0:
+            raise ValueError(f"File contains no data rows: {file_name}")
+
+        return ManifestFileEntry(
+            source_vendor=vendor,
+            source_file=file_name,
+            relative_path=relative_path,
+            size_bytes=size,
+            modified_time_utc=mtime,
+            sha256=sha,
+            row_count_read=rows,
+            status="success",
+            error=None,
+        )
+
+    except Exception as e:
+        logger.error(f"Error processing {file_name}: {e}")
+        return ManifestFileEntry(
+            source_vendor=vendor,
+            source_file=file_name,
+            relative_path=relative_path,
+            size_bytes=size,
+            modified_time_utc=mtime,
+            sha256=sha,
+            row_count_read=0,
+            status="failed",
+            error=str(e),
+        )
+
 def build_staging_manifest(root: Path, load_run_id: str, require_non_empty: bool = True) -> Path:
     """
     Scans input files, computes checksums and row counts, and writes a JSON manifest.
     This manifest serves as a technical log for the current ingestion run.
+    Files are independent, so they are processed concurrently (hashing releases the GIL).
+    Checksums of inputs unchanged since the last run come from output/.hash_cache.json.
     """
     input_dir = root / "input"
     output_dir = root / "output"
@@ -216,56 +493,16 @@ def build_staging_manifest(root: Path, load_run_id: str, require_non_empty: bool
     output_dir.mkdir(parents=True, exist_ok=True)
     manifests_dir.mkdir(parents=True, exist_ok=True)
 
-    entries: list[ManifestFileEntry] = []
-
-    for spec in EXPECTED_INPUTS:
-        vendor = spec["source_vendor"]
-        file_name = spec["file_name"]
-        fmt = spec["format"]
-        file_path = input_dir / file_name
+    hash_cache_path = output_dir / HASH_CACHE_FILE
+    hash_cache = load_hash_cache(hash_cache_path)
 
-        try:
-            if not file_path.exists():
-                raise FileNotFoundError(f"Missing expected input file: {file_path}")
-
-            # Collect metadata
-            size = file_path.stat().st_size
-            mtime = file_modified_time_utc(file_path)
-            sha = compute_sha256(file_path)
-            rows = count_rows_by_format(file_path, fmt, spec)
+    # executor.map keeps results in EXPECTED_INPUTS order; workers write distinct cache keys
+    with ThreadPoolExecutor(max_workers=len(EXPECTED_INPUTS)) as executor:
+        entries: list[ManifestFileEntry] = list(
+            executor.map(lambda spec: _process_spec(root, spec, require_non_empty, hash_cache), EXPECTED_INPUTS)
+        )
 
-            if require_non_empty and rows == 0:
-                raise ValueError(f"File contains no data rows: {file_name}")
-
-            entries.append(
-                ManifestFileEntry(
-                    source_vendor=vendor,
-                    source_file=file_name,
-                    relative_path=str(file_path.relative_to(root)),
-                    size_bytes=size,
-                    modified_time_utc=mtime,
-                    sha256=sha,
-                    row_count_read=rows,
-                    status="success",
-                    error=None,
-                )
-            )
-
-        except Exception as e:
-            logger.error(f"Error processing {file_name}: {e}")
-            entries.append(
-                ManifestFileEntry(
-                    source_vendor=vendor,
-                    source_file=file_name,
-                    relative_path=str(file_path.relative_to(root)) if file_path.exists() else f"input/{file_name}",
-                    size_bytes=file_path.stat().st_size if file_path.exists() else 0,
-                    modified_time_utc=file_modified_time_utc(file_path) if file_path.exists() else "",
-                    sha256=compute_sha256(file_path) if file_path.exists() else "",
-                    row_count_read=0,
-                    status="failed",
-                    error=str(e),
-                )
-            )
+    save_hash_cache(hash_cache_path, hash_cache)
 
     # Wrap as manifest object
     manifest = StagingManifest(
@@ -279,9 +516,10 @@ def build_staging_manifest(root: Path, load_run_id: str, require_non_empty: bool
     manifest_path = manifests_dir / f"manifest_{load_run_id}.json"
     latest_path = output_dir / "staging_manifest_latest.json"
 
-    content = json.dumps(asdict(manifest), ensure_ascii=False, indent=2)
-    manifest_path.write_text(content, encoding="utf-8")
-    latest_path.write_text(content, encoding="utf-8")
+    # Serialized and written once; latest is a second directory entry for the same file
+    content = _dumps_manifest(_manifest_payload(manifest))
+    manifest_path.write_bytes(content)
+    _publish_latest(manifest_path, latest_path, content)
 
     logger.info(f"Manifest generated successfully: {manifest_path}")
     return manifest_path
\ No newline at end of file
@@ -1,51 +1,121 @@
-import pandas as pd
-import yaml
 import sqlite3
+import numpy as np
+import pandas as pd
 import hashlib
 import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import chain, islice
 from pathlib import Path
+from pipeline.db import bulk_load, open_conn
+from pipeline.yaml_config import load_yaml
+
+try:
+    # Optional Rust-backed Excel engine for pd.read_excel; openpyxl is used when it is missing
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
+
+# Initialize Logger
+logger = logging.getLogger(__name__)
+
+# Canonical raw_staging column order
+STAGING_COLUMNS = [
+    "source_vendor", "source_file", "source_row", "load_run_id", "ingested_at",
+    "source_extract_date", "record_hash_raw", "group_id_raw", "subscriber_id_raw",
+    "person_id_raw", "dependent_seq_raw", "ssn_hash_raw", "first_name_raw",
+    "last_name_raw", "dob_raw", "relationship_raw", "address_line1", "city",
+    "state", "zip", "plan_type", "provider", "plan_id", "plan_tier",
+    "is_active_raw", "extra_payload"
+]
+
+STAGING_INSERT_SQL = (
+    f"INSERT INTO raw_staging ({', '.join(STAGING_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(STAGING_COLUMNS))})"
+)
+
+# Rows per multi-row INSERT; 500 x 26 binds stays under SQLITE_MAX_VARIABLE_NUMBER (32766 since 3.32)
+INSERT_CHUNK_ROWS = 500
+STAGING_INSERT_CHUNK_SQL = (
+    f"INSERT INTO raw_staging ({', '.join(STAGING_COLUMNS)}) VALUES "
+    + ", ".join([f"({', '.join('?' * len(STAGING_COLUMNS))})"] * INSERT_CHUNK_ROWS)
+)
+
+# Loads at least this large (total input bytes) prepare vendor frames in worker processes;
+# below it, process start-up and pickling the frames back cost more than the parse they parallelize
+PARALLEL_INGEST_MIN_BYTES = 64 * 1024 * 1024
+
+# Upper bound on ingest worker processes (one per vendor file at most)
+PARALLEL_INGEST_MAX_WORKERS = os.cpu_count() or 1
+
+# Medical C nested objects -> keys flattened into "<object>.<key>" columns, resolved once at import
+MEDICAL_C_NESTED_FIELDS = {
+    'name': ('first', 'last'),
+    'address': ('street', 'city', 'state', 'zip'),
+    'plan': ('plan_id', 'tier'),
+}
+MEDICAL_C_FLAT_COLUMNS = {
+    parent: tuple((f'{parent}.{key}', key) for key in keys)
+    for parent, keys in MEDICAL_C_NESTED_FIELDS.items()
+}
 
 def load_mapping(mapping_path: Path) -> dict:
-    """Loads YAML mapping configuration for a specific vendor."""
-    with open(mapping_path, 'r') as f:
-        return yaml.safe_load(f)
+    """
+    Loads YAML mapping configuration for a specific vendor.
+    Parsed mappings are cached per (path, mtime_ns); callers must treat them as read-only.
+    """
+    return load_yaml(mapping_path)
+
+# json.dumps(..., sort_keys=True) builds a fresh JSONEncoder per call; this one encodes identically
+ROW_HASH_ENCODER = json.JSONEncoder(sort_keys=True)
 
 def generate_row_hash(row_dict: dict) -> str:
     """Generates a unique SHA-256 hash for a raw data row to ensure traceability."""
-    row_str = json.dumps(row_dict, sort_keys=True)
-    return hashlib.sha256(row_str.encode()).hexdigest()
+    row_str = ROW_HASH_ENCODER.encode(row_dict)
+    return hashlib.sha256(row_str.encode(), usedforsecurity=False).hexdigest()
+
+def generate_row_hashes(df_raw: pd.DataFrame) -> list[str]:
+    """
+    Row hashes for a whole frame, equal to generate_row_hash(row.to_dict()) per row.
+    Each column is boxed to Python values once (Series.tolist) and rows are zipped back into
+    dicts, which skips to_dict('records')'s per-value boxing and per-row Series.
+    """
+    columns = list(df_raw.columns)
+    column_values = [df_raw.iloc[:, i].tolist() for i in range(len(columns))]
+    return [generate_row_hash(dict(zip(columns, row))) for row in zip(*column_values)]
 
 def transform_medical_c(df: pd.DataFrame) -> pd.DataFrame:
     """
     STRENGTHENED: Handles Medical Provider C nested JSON and split dates.
     Ensures nested objects are flattened so they can be mapped correctly.
     """
-    # 1. Flatten Nested Name
-    if 'name' in df.columns:
-        df['name.first'] = df['name'].apply(lambda x: x.get('first') if isinstance(x, dict) else None)
-        df['name.last'] = df['name'].apply(lambda x: x.get('last') if isinstance(x, dict) else None)
-
-    # 2. Flatten Nested Address
-    if 'address' in df.columns:
-        df['address.street'] = df['address'].apply(lambda x: x.get('street') if isinstance(x, dict) else None)
-        df['address.city'] = df['address'].apply(lambda x: x.get('city') if isinstance(x, dict) else None)
-        df['address.state'] = df['address'].apply(lambda x: x.get('state') if isinstance(x, dict) else None)
-        df['address.zip'] = df['address'].apply(lambda x: x.get('zip') if isinstance(x, dict) else None)
-
-    # 3. Flatten Nested Plan details
-    if 'plan' in df.columns:
-        df['plan.plan_id'] = df['plan'].apply(lambda x: x.get('plan_id') if isinstance(x, dict) else None)
-        df['plan.tier'] = df['plan'].apply(lambda x: x.get('tier') if isinstance(x, dict) else None)
+    # 1-3. Flatten Nested Name / Address / Plan details
+    # Target columns come precomputed from MEDICAL_C_FLAT_COLUMNS; each object column is walked once
+    for parent, flat_columns in MEDICAL_C_FLAT_COLUMNS.items():
+        if parent not in df.columns:
+            continue
+        objects = [x if isinstance(x, dict) else {} for x in df[parent]]
+        for column, key in flat_columns:
+            df[column] = [obj.get(key) for obj in objects]
 
     # 4. Assemble Split DOB with Zero-Padding
     # We use zfill(2) to ensure 2016-5-21 becomes 2016-05-21 for consistent parsing
+    # Built in one pass over plain Python values; invalid parts (e.g. month 13) stay in the raw string
+    # for Stage 2 to flag, and a missing part leaves dob_raw missing, as the string concat did
     date_parts = ['dob_year', 'dob_month', 'dob_day']
     if all(col in df.columns for col in date_parts):
-        df['dob_raw'] = (
-            df['dob_year'].astype(str) + '-' +
-            df['dob_month'].astype(str).str.zfill(2) + '-' +
-            df['dob_day'].astype(str).str.zfill(2)
+        missing = df[date_parts].isna().any(axis=1).tolist()
+        years, months, days = (df[col].tolist() for col in date_parts)
+        df['dob_raw'] = pd.Series(
+            [
+                None if is_missing else f"{y}-{str(m).zfill(2)}-{str(d).zfill(2)}"
+                for is_missing, y, m, d in zip(missing, years, months, days)
+            ],
+            index=df.index,
+            dtype="str",
         )
     return df
 def read_source_file(file_path: Path, mapping: dict) -> pd.DataFrame:
@@ -56,20 +126,107 @@ def read_source_file(file_path: Path, mapping: dict) -> pd.DataFrame:
         elif fmt == 'txt':
             return pd.read_csv(file_path, sep=mapping.get('delimiter', '|'))
         elif fmt == 'xlsx':
-            return pd.read_excel(file_path, sheet_name=mapping.get('sheet_name'))
+            return pd.read_excel(file_path, sheet_name=mapping.get('sheet_name'), engine=EXCEL_ENGINE)
         elif fmt == 'jsonl':
             return pd.read_json(file_path, lines=True)
     except Exception as e:
         logger.error(f"Failed to read {file_path}: {e}")
     return None
-def ingest_stage1_hybrid(root: Path, load_run_id: str, yaml_dir: Path):
+def constant_column(value: str, n_rows: int) -> pd.Categorical:
+    """
+    A per-file metadata value broadcast to n_rows as a one-category Categorical:
+    one int8 code per row instead of one object pointer per row.
+    """
+    return pd.Categorical.from_codes(np.zeros(n_rows, dtype=np.int8), categories=[value])
+
+def insert_staging_rows(conn: sqlite3.Connection, df_staging: pd.DataFrame) -> int:
+    """
+    Writes canonical staging rows streamed from itertuples, INSERT_CHUNK_ROWS at a time through one
+    prepared multi-row INSERT (one VDBE run per chunk); the short tail goes through executemany.
+    Columns are projected onto STAGING_COLUMNS in one reindex (absent ones become NULL), so
+    rows come out in STAGING_INSERT_SQL's bind order.
+    NaN/NaT become NULL and numpy scalars become plain Python values before binding.
+    """
+    df_out = df_staging.reindex(columns=STAGING_COLUMNS).astype(object)
+    df_out = df_out.where(df_out.notna(), None)
+
+    rows = df_out.itertuples(index=False, name=None)
+    while True:
+        chunk = list(islice(rows, INSERT_CHUNK_ROWS))
+        if len(chunk) < INSERT_CHUNK_ROWS:
+            conn.executemany(STAGING_INSERT_SQL, chunk)
+            break
+        conn.execute(STAGING_INSERT_CHUNK_SQL, tuple(chain.from_iterable(chunk)))
+    return len(df_out)
+
+def prepare_staging_frame(
+    file_path: Path, file_name: str, mapping: dict, load_run_id: str, ingested_at: str
+) -> pd.DataFrame | None:
+    """
+    Reads one vendor file and builds its staging frame (everything before the SQLite insert).
+    Takes only picklable arguments and touches no connection, so it can run in a worker process.
+    Returns None when the file could not be read.
+    """
+    vendor = mapping['source_vendor']
+
+    df_raw = read_source_file(file_path, mapping)
+    if df_raw is None:
+        return None
+
+    # --- CUSTOM TRANSFORMATIONS (The Strategy Hook) ---
+    if vendor == 'medical_provider_c':
+        df_raw = transform_medical_c(df_raw)
+
+    # Hash each raw row under its source column names, before they are mapped
+    record_hashes = generate_row_hashes(df_raw)
+
+    # Apply column mapping from YAML, relabelling df_raw in place (source names are not needed past here)
+    col_map = mapping.get('column_mapping', {})
+    df_raw.columns = [col_map.get(col, col) for col in df_raw.columns]
+    df_staging = df_raw
+
+    # Metadata enrichment (constants stay dictionary-encoded until insert_staging_rows binds them)
+    n_rows = len(df_staging)
+    df_staging['source_vendor'] = constant_column(vendor, n_rows)
+    df_staging['source_file'] = constant_column(file_name, n_rows)
+    df_staging['load_run_id'] = constant_column(load_run_id, n_rows)
+    df_staging['ingested_at'] = constant_column(ingested_at, n_rows)
+    df_staging['plan_type'] = constant_column(mapping['plan_type'], n_rows)
+    df_staging['provider'] = constant_column(mapping['provider'], n_rows)
+    df_staging['source_row'] = np.arange(1, n_rows + 1, dtype=np.int32)
+    df_staging['record_hash_raw'] = record_hashes
+    return df_staging
+
+def iter_staging_frames(work: list[tuple[Path, str, dict]], load_run_id: str, ingested_at: str):
+    """
+    Yields (mapping, staging frame) for each (file_path, file_name, mapping) in work, in order.
+    Large loads on multi-core hosts fan the files out to a ProcessPoolExecutor; the caller
+    still inserts serially, overlapping with the files still being prepared.
+    """
+    workers = min(len(work), PARALLEL_INGEST_MAX_WORKERS)
+    total_bytes = sum(file_path.stat().st_size for file_path, _, _ in work)
+
+    if workers > 1 and total_bytes >= PARALLEL_INGEST_MIN_BYTES:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(prepare_staging_frame, file_path, file_name, mapping, load_run_id, ingested_at)
+                for file_path, file_name, mapping in work
+            ]
+            for (_, _, mapping), future in zip(work, futures):
+                yield mapping, future.result()
+        return
+
+    for file_path, file_name, mapping in work:
+        yield mapping, prepare_staging_frame(file_path, file_name, mapping, load_run_id, ingested_at)
+
+def ingest_stage1_hybrid(root: Path, load_run_id: str, yaml_dir: Path, conn: sqlite3.Connection | None = None):
     """
     Orchestrates Stage 1: Ingests raw files into Bronze layer (Staging + Payload tables).
     Includes custom transformation hooks for specific vendors.
+    If conn is given (shared run connection) it is used and left open.
     """
     db_path = root / "output" / "warehouse.db"
     input_dir = root / "input"
-    conn = sqlite3.connect(db_path)
 
     # Dictionary mapping physical files to their logic-defining YAML configurations
     file_map = {
@@ -80,7 +237,11 @@ def ingest_stage1_hybrid(root: Path, load_run_id: str, yaml_dir: Path):
         "vision_provider.csv": "vision.yaml"
     }
 
-    inserted_counts = {}
+    # One ingest timestamp for the whole load, shared by every vendor file
+    ingested_at = datetime.now().isoformat()
+
+    # Files present alongside their mapping, in file_map order
+    work = []
     for file_name, yaml_name in file_map.items():
         file_path = input_dir / file_name
         mapping_path = yaml_dir / yaml_name
@@ -88,47 +249,26 @@ def ingest_stage1_hybrid(root: Path, load_run_id: str, yaml_dir: Path):
         if not file_path.exists() or not mapping_path.exists():
             continue
 
-        mapping = load_mapping(mapping_path)
-        vendor = mapping['source_vendor']
-
-        df_raw = read_source_file(file_path, mapping)
-        if df_raw is None: continue
-
-        # --- CUSTOM TRANSFORMATIONS (The Strategy Hook) ---
-        if vendor == 'medical_provider_c':
-            df_raw = transform_medical_c(df_raw)
-
-        # Apply column mapping from YAML
-        col_map = mapping.get('column_mapping', {})
-        df_staging = df_raw.rename(columns=col_map)
-
-        # Metadata enrichment
-        df_staging['source_vendor'] = vendor
-        df_staging['source_file'] = file_name
-        df_staging['load_run_id'] = load_run_id
-        df_staging['ingested_at'] = datetime.now().isoformat()
-        df_staging['plan_type'] = mapping['plan_type']
-        df_staging['provider'] = mapping['provider']
-        df_staging['source_row'] = range(1, len(df_staging) + 1)
-        df_staging['record_hash_raw'] = df_raw.apply(lambda x: generate_row_hash(x.to_dict()), axis=1)
-
-        # Canonical Columns Enforcement
-        staging_columns = [
-            "source_vendor", "source_file", "source_row", "load_run_id", "ingested_at",
-            "source_extract_date", "record_hash_raw", "group_id_raw", "subscriber_id_raw",
-            "person_id_raw", "dependent_seq_raw", "ssn_hash_raw", "first_name_raw",
-            "last_name_raw", "dob_raw", "relationship_raw", "address_line1", "city",
-            "state", "zip", "plan_type", "provider", "plan_id", "plan_tier",
-            "is_active_raw", "extra_payload"
-        ]
-
-        for col in staging_columns:
-            if col not in df_staging.columns:
-                df_staging[col] = None
-
-        # Write to SQLite
-        df_staging[staging_columns].to_sql('raw_staging', conn, if_exists='append', index=False)
-        inserted_counts[vendor] = len(df_staging)
-
-    conn.close()
+        work.append((file_path, file_name, load_mapping(mapping_path)))
+
+    owns_conn = conn is None
+    if owns_conn:
+        conn = open_conn(db_path)
+
+    try:
+        # The whole ingest is one write transaction (opened by bulk_load); every file's executemany shares it
+        inserted_counts = {}
+        with bulk_load(conn):
+            for mapping, df_staging in iter_staging_frames(work, load_run_id, ingested_at):
+                if df_staging is None: continue
+
+                # Canonical Columns Enforcement + write to SQLite
+                inserted_counts[mapping['source_vendor']] = insert_staging_rows(conn, df_staging)
+
+        # Refresh planner statistics so downstream lineage checks pick the composite indexes;
+        # only raw_staging (and its indexes) changed here, so the rest of the warehouse is not re-scanned
+        conn.execute("ANALYZE raw_staging;")
+    finally:
+        if owns_conn:
+            conn.close()
     return inserted_counts
\ No newline at end of file
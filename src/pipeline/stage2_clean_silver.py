@@ -1,9 +1,10 @@
+import re
 import sqlite3
-import pandas as pd
 import logging
-import yaml
-from datetime import datetime
+from datetime import date, datetime
 from pathlib import Path
+from pipeline.db import open_conn
+from pipeline.yaml_config import load_yaml
 
 # Global Configuration Constants
 CONFIG_PATH = "mappings/relationship_normalization.yaml"
@@ -17,6 +18,7 @@ def load_normalization_config(root: Path) -> dict:
 	"""
 	Loads the central normalization mapping file (YAML).
 	Architecture: Decouples business rules (YAML) from the logic engine (Python).
+	Parsed with libyaml when available and cached per (path, mtime_ns), so reruns skip the parse.
 	"""
 	path = root / CONFIG_PATH
 	if not path.exists():
@@ -24,32 +26,145 @@ def load_normalization_config(root: Path) -> dict:
 		return {}
 
 	try:
-		with open(path, 'r', encoding='utf-8') as f:
-			config = yaml.safe_load(f)
-			logger.info("Normalization mapping file loaded successfully.")
-			return config or {}
+		config = load_yaml(path)
+		logger.info("Normalization mapping file loaded successfully.")
+		return config or {}
 	except Exception as e:
 		logger.error(f"Error parsing YAML file: {e}")
 		return {}
 
 
-def clean_name(series: pd.Series) -> pd.Series:
+# Deletes every Latin-1 code point outside [a-z0-9] in one str.translate pass
+# (_NON_ALNUM handles what is left above U+00FF)
+_NON_ALNUM = re.compile(r'[^a-z0-9]')
+_NAME_DROP_TABLE = str.maketrans('', '', ''.join(
+	chr(c) for c in range(256) if not ('a' <= chr(c) <= 'z' or '0' <= chr(c) <= '9')
+))
+
+
+def clean_name(value: str | None) -> str | None:
 	"""
 	Global name cleaning logic:
 	Converts to lowercase, removes non-alphanumeric characters, and strips whitespace.
+	Registered as a deterministic SQLite function so it runs inside the Silver INSERT.
+	A translate table does the removal; only names still holding characters above U+00FF
+	(which the table cannot list) go through the regex.
+	"""
+	if value is None:
+		return None
+	cleaned = str(value).casefold().translate(_NAME_DROP_TABLE)
+	if cleaned.isascii():
+		return cleaned
+	return _NON_ALNUM.sub('', cleaned)
+
+
+# Fixed-width numeric vendor formats, parsed by one regex match instead of strptime.
+# Values these patterns do not match (single-digit parts, years before 1000, ...) still go to strptime.
+_FIXED_WIDTH_DOB_FORMATS = {
+	'%Y-%m-%d': re.compile(r'(?P<y>[0-9]{4})-(?P<m>[0-9]{2})-(?P<d>[0-9]{2})'),
+	'%m/%d/%Y': re.compile(r'(?P<m>[0-9]{2})/(?P<d>[0-9]{2})/(?P<y>[0-9]{4})'),
+	'%Y%m%d': re.compile(r'(?P<y>[0-9]{4})(?P<m>[0-9]{2})(?P<d>[0-9]{2})'),
+}
+
+
+def _strptime_dob(value: str, fmt: str) -> str | None:
+	"""General path: any strftime format, via datetime.strptime."""
+	try:
+		return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+	except ValueError:
+		return None
+
+
+def normalize_dob(value: str | None, fmt: str | None) -> str | None:
 	"""
-	return (
-		series.astype(str)
-		.str.casefold()
-		.str.replace(r'[^a-z0-9]', '', regex=True)
-		.str.strip()
+	Parses a raw DOB with the vendor's strftime format and returns YYYY-MM-DD.
+	Invalid dates (e.g., 99/99/9999) and vendors without a configured format yield NULL.
+	The vendor format picks the parser: fixed-width numeric formats are matched and
+	validated directly, everything else goes through strptime.
+	"""
+	if value is None or fmt is None:
+		return None
+	value = str(value).strip()
+
+	pattern = _FIXED_WIDTH_DOB_FORMATS.get(fmt)
+	match = pattern.fullmatch(value) if pattern else None
+	if match is None or match['y'] < '1000':
+		return _strptime_dob(value, fmt)
+
+	try:
+		date(int(match['y']), int(match['m']), int(match['d']))
+	except ValueError:
+		return None
+	return f"{match['y']}-{match['m']}-{match['d']}"
+
+
+# Canonical column order for the Silver table
+SILVER_COLUMNS = [
+	'load_run_id', 'source_vendor', 'source_file', 'source_row', 'record_hash_raw',
+	'first_name_norm', 'last_name_norm', 'dob_norm', 'relationship_norm',
+	'plan_type', 'provider', 'first_name_raw', 'last_name_raw', 'dob_raw',
+	'relationship_raw', 'ingested_at', 'cleaned_at'
+]
+
+# silver_members primary key (UPSERT conflict target)
+SILVER_KEY = ['load_run_id', 'source_vendor', 'source_row']
+
+# Bronze -> Silver in one statement: names and dates go through the registered functions,
+# relationships and date formats are looked up in TEMP tables loaded from the YAML config.
+# The UPSERT makes re-running Stage 2 for the same load run refresh rows instead of failing on the PK.
+SILVER_INSERT_SQL = f"""
+	INSERT INTO silver_members ({', '.join(SILVER_COLUMNS)})
+	SELECT
+		r.load_run_id, r.source_vendor, r.source_file, r.source_row, r.record_hash_raw,
+		clean_name(r.first_name_raw),
+		clean_name(r.last_name_raw),
+		normalize_dob(r.dob_raw, f.fmt),
+		COALESCE(m.norm_value, 'OTHER'),
+		r.plan_type, r.provider, r.first_name_raw, r.last_name_raw, r.dob_raw,
+		r.relationship_raw, r.ingested_at, :cleaned_at
+	FROM raw_staging r
+	LEFT JOIN temp.stage2_date_formats f
+		ON f.source_vendor = r.source_vendor
+	LEFT JOIN temp.stage2_relationship_map m
+		ON m.source_vendor = r.source_vendor
+		AND m.raw_value = lower(trim(r.relationship_raw))
+	WHERE r.load_run_id = :load_run_id
+	ON CONFLICT ({', '.join(SILVER_KEY)}) DO UPDATE SET
+		{', '.join(f"{col} = excluded.{col}" for col in SILVER_COLUMNS if col not in SILVER_KEY)}
+"""
+
+
+def _load_lookup_tables(conn: sqlite3.Connection, rel_maps: dict, date_formats: dict):
+	"""
+	(Re)creates the per-connection TEMP lookup tables used by SILVER_INSERT_SQL.
+	"""
+	conn.execute("DROP TABLE IF EXISTS temp.stage2_relationship_map")
+	conn.execute("DROP TABLE IF EXISTS temp.stage2_date_formats")
+	conn.execute(
+		"CREATE TEMP TABLE stage2_relationship_map "
+		"(source_vendor TEXT, raw_value TEXT, norm_value TEXT, PRIMARY KEY (source_vendor, raw_value))"
+	)
+	conn.execute("CREATE TEMP TABLE stage2_date_formats (source_vendor TEXT PRIMARY KEY, fmt TEXT)")
+
+	conn.executemany(
+		"INSERT OR REPLACE INTO temp.stage2_relationship_map VALUES (?, ?, ?)",
+		[
+			(vendor, str(raw).lower().strip(), norm)
+			for vendor, mapping in rel_maps.items()
+			for raw, norm in (mapping or {}).items()
+		],
+	)
+	conn.executemany(
+		"INSERT INTO temp.stage2_date_formats VALUES (?, ?)",
+		list(date_formats.items()),
 	)
 
 
-def run_stage2_cleaning(root: Path, load_run_id: str) -> int:
+def run_stage2_cleaning(root: Path, load_run_id: str, conn: sqlite3.Connection | None = None) -> int:
 	"""
 	Stage 2: Data Cleaning and Normalization (Silver Layer).
 	Performs vendor-specific date parsing and relationship mapping.
+	If conn is given (shared run connection) it is used and left open.
 	"""
 	# 1. Load normalization rules from config
 	full_config = load_normalization_config(root)
@@ -57,64 +172,41 @@ def run_stage2_cleaning(root: Path, load_run_id: str) -> int:
 	date_formats = full_config.get('date_formats', {})
 
 	db_path = root / OUTPUT_DB
-	conn = sqlite3.connect(db_path)
+	owns_conn = conn is None
+	if owns_conn:
+		conn = open_conn(db_path)
 
 	try:
-		# Fetch raw data for the specific load run
-		query = "SELECT * FROM raw_staging WHERE load_run_id = ?"
-		df = pd.read_sql(query, conn, params=(load_run_id,))
-
-		if df.empty:
+		# 2. Expose the normalization rules to SQLite
+		conn.create_function("clean_name", 1, clean_name, deterministic=True)
+		conn.create_function("normalize_dob", 2, normalize_dob, deterministic=True)
+
+		# 3. Normalize and persist to the Silver Layer inside a single write transaction
+		if conn.in_transaction:
+			conn.commit()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			_load_lookup_tables(conn, rel_maps, date_formats)
+			cur = conn.execute(
+				SILVER_INSERT_SQL,
+				{"load_run_id": load_run_id, "cleaned_at": datetime.now().isoformat()},
+			)
+			silver_count = cur.rowcount
+			conn.commit()
+		except Exception:
+			conn.rollback()
+			raise
+
+		if silver_count == 0:
 			logger.warning(f"No raw records found for RunID: {load_run_id}")
 			return 0
 
-		# 2. Global Name Normalization
-		df['first_name_norm'] = clean_name(df['first_name_raw'])
-		df['last_name_norm'] = clean_name(df['last_name_raw'])
-
-		# 3. Vendor-Specific Date of Birth (DOB) Normalization
-		# Logic: Uses the date_formats map to parse strings into actual dates
-		df['dob_norm'] = None
-		for vendor, fmt in date_formats.items():
-			mask = df['source_vendor'] == vendor
-			if mask.any():
-				logger.info(f"Normalizing dates for {vendor} using format {fmt}")
-				# Clean raw strings before parsing to prevent NaT failures
-				raw_dates = df.loc[mask, 'dob_raw'].astype(str).str.strip()
-				# errors='coerce' turns invalid dates (e.g., 99/99/9999) into NULL
-				parsed = pd.to_datetime(raw_dates, format=fmt, errors='coerce')
-				df.loc[mask, 'dob_norm'] = parsed.dt.strftime('%Y-%m-%d')
-
-		# 4. Vendor-Specific Relationship Normalization
-		# Logic: Maps source values (e.g., 'EMP') to target values (e.g., 'employee')
-		df['relationship_norm'] = 'OTHER'
-		for vendor, mapping in rel_maps.items():
-			mask = df['source_vendor'] == vendor
-			if mask.any():
-				# Extract and clean raw values for lookup
-				raw_rels = df.loc[mask, 'relationship_raw'].astype(str).str.lower().str.strip()
-				# Apply the map and default unknown values to 'OTHER'
-				df.loc[mask, 'relationship_norm'] = raw_rels.map(mapping).fillna('OTHER')
-
-		# 5. Persist to Silver Layer
-		df['cleaned_at'] = datetime.now().isoformat()
-
-		# Define the canonical column order for the Silver table
-		silver_cols = [
-			'load_run_id', 'source_vendor', 'source_file', 'source_row', 'record_hash_raw',
-			'first_name_norm', 'last_name_norm', 'dob_norm', 'relationship_norm',
-			'plan_type', 'provider', 'first_name_raw', 'last_name_raw', 'dob_raw',
-			'relationship_raw', 'ingested_at', 'cleaned_at'
-		]
-
-		# Write data to SQL
-		df[silver_cols].to_sql('silver_members', conn, if_exists='append', index=False)
-		logger.info(f"Normalization complete. {len(df)} records saved to Silver Layer.")
-
-		return len(df)
+		logger.info(f"Normalization complete. {silver_count} records saved to Silver Layer.")
+		return silver_count
 
 	except Exception as e:
 		logger.error(f"Pipeline crashed during Stage 2: {e}")
 		raise
 	finally:
-		conn.close()
\ No newline at end of file
+		if owns_conn:
+			conn.close()
@@ -0,0 +1,21 @@
+from functools import lru_cache
+from pathlib import Path
+
+import yaml
+
+# libyaml-backed loader when PyYAML was built with it, else the pure-Python SafeLoader
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@lru_cache(maxsize=32)
+def _load_yaml_cached(path: Path, mtime_ns: int):
+    """Parses one YAML file; mtime_ns is part of the cache key so edits are picked up."""
+    return yaml.load(path.read_bytes(), Loader=YAML_LOADER)
+
+
+def load_yaml(path: Path):
+    """
+    Loads a YAML config file, cached per (path, mtime_ns) for the life of the process.
+    The parsed object is shared between callers, so treat it as read-only.
+    """
+    return _load_yaml_cached(path, path.stat().st_mtime_ns)
@@ -1,6 +1,7 @@
 from pathlib import Path
 import sqlite3
 import pytest
+from pipeline.db import open_ro
 from pipeline.stage0_init_db import init_db
 
 # Define the DDL here to make the test self-contained and independent of external files
@@ -31,16 +32,28 @@ CREATE TABLE raw_staging_payload (
 );
 """
 
+DDL_03 = """
+-- 03_create_silver_members.sql
+CREATE TABLE silver_members (
+    load_run_id TEXT, 
+    source_vendor TEXT, 
+    source_row INTEGER, 
+    first_name_norm TEXT, 
+    PRIMARY KEY (load_run_id, source_vendor, source_row)
+);
+"""
+
 def _setup_sql_files(root: Path):
     """
-    Creates the 'sql' directory with the two specific SQL files
+    Creates the 'sql' directory with the three specific SQL files
     that the init_db function expects to find.
     """
     sql_dir = root / "sql"
     sql_dir.mkdir(parents=True, exist_ok=True)
-    # The init_db logic specifically looks for these two file names
+    # The init_db logic specifically looks for these three file names
     (sql_dir / "01_create_raw_staging.sql").write_text(DDL_01)
     (sql_dir / "02_create_raw_staging_payload.sql").write_text(DDL_02)
+    (sql_dir / "03_create_silver_members.sql").write_text(DDL_03)
 
 
 def test_stage0_init_db_creates_tables(tmp_path: Path):
@@ -67,6 +80,69 @@ def test_stage0_init_db_creates_tables(tmp_path: Path):
     conn.close()
 
 
+def test_stage0_init_db_skips_ddl_on_warm_db(tmp_path: Path):
+    """
+    Ensures a second init_db call on an unchanged schema does not re-run the DDL.
+    The DDL above has no IF NOT EXISTS, so re-executing it would raise.
+    """
+    # Arrange
+    _setup_sql_files(tmp_path)
+    init_db(tmp_path)
+
+    # Act
+    db_path = init_db(tmp_path)
+
+    # Assert
+    conn = sqlite3.connect(db_path)
+    user_version = conn.execute("PRAGMA user_version;").fetchone()[0]
+    conn.close()
+    assert user_version != 0
+
+
+def test_stage0_init_db_repairs_dropped_table(tmp_path: Path):
+    """
+    Ensures init_db re-runs the (idempotent) DDL when the schema fingerprint
+    is current but a table has been dropped since, instead of failing.
+    """
+    # Arrange
+    _setup_sql_files(tmp_path)
+    for ddl_path in (tmp_path / "sql").glob("*.sql"):
+        ddl_path.write_text(ddl_path.read_text().replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS"))
+    db_path = init_db(tmp_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE silver_members;")
+    conn.commit()
+    conn.close()
+
+    # Act
+    init_db(tmp_path)
+
+    # Assert
+    conn = sqlite3.connect(db_path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")}
+    conn.close()
+    assert "silver_members" in tables
+
+
+def test_open_ro_handles_uri_characters_in_path(tmp_path: Path):
+    """
+    Ensures the read-only connection opens the warehouse itself when its
+    path contains characters that are special in a SQLite URI.
+    """
+    # Arrange
+    project_root = tmp_path / "proj#1 ?50%"
+    _setup_sql_files(project_root)
+    db_path = init_db(project_root)
+
+    # Act
+    conn = open_ro(db_path)
+    rows = conn.execute("SELECT COUNT(*) FROM raw_staging;").fetchone()[0]
+    conn.close()
+
+    # Assert
+    assert rows == 0
+
+
 def test_stage0_init_db_raises_error_on_missing_sql(tmp_path: Path):
     """
     Ensures that init_db raises a FileNotFoundError if the mandatory
@@ -1,7 +1,21 @@
 import json
+import timeit
 from pathlib import Path
 import pytest
-from pipeline.stage0_manifest import build_staging_manifest, generate_load_run_id
+from pipeline import stage0_manifest
+from pipeline.stage0_manifest import (
+	build_staging_manifest,
+	compute_sha256,
+	count_rows_by_format,
+	count_rows_jsonl,
+	generate_load_run_id,
+	scan_file,
+)
+
+
+def _best_time(fn) -> float:
+	"""Fastest of a few single runs, to keep timing comparisons steady."""
+	return min(timeit.repeat(fn, number=1, repeat=5))
 
 
 def _create_mock_files(input_dir: Path):
@@ -57,4 +71,164 @@ def test_manifest_marks_missing_files_as_failed(tmp_path: Path):
 		# All files should have a failed status
 		for entry in data["files"]:
 			assert entry["status"] == "failed"
-			assert "Missing expected input file" in entry["error"]
\ No newline at end of file
+			assert "Missing expected input file" in entry["error"]
+
+
+def test_manifest_records_stat_errors_as_failed(tmp_path: Path, monkeypatch):
+	"""Verifies inputs that cannot be stat'ed (input/ not a directory, permission denied) become failed entries."""
+	(tmp_path / "input").write_text("not a directory")
+	data = json.loads(build_staging_manifest(tmp_path, generate_load_run_id(), require_non_empty=False).read_text(encoding="utf-8"))
+	assert all(entry["status"] == "failed" for entry in data["files"])
+	assert all("Missing expected input file" in entry["error"] for entry in data["files"])
+
+	(tmp_path / "input").unlink()
+	_create_mock_files(tmp_path / "input")
+	real_stat = stage0_manifest.os.stat
+
+	def _stat(path, *args, **kwargs):
+		if Path(path).name == "medical_provider_a.csv":
+			raise PermissionError(13, "Permission denied", str(path))
+		return real_stat(path, *args, **kwargs)
+
+	monkeypatch.setattr(stage0_manifest.os, "stat", _stat)
+	data = json.loads(build_staging_manifest(tmp_path, generate_load_run_id(), require_non_empty=False).read_text(encoding="utf-8"))
+	med_a = next(entry for entry in data["files"] if entry["source_vendor"] == "medical_a")
+	assert med_a["status"] == "failed"
+	assert "Permission denied" in med_a["error"]
+
+@pytest.mark.parametrize("content", [
+	"id,name\n1,John\n\n2,Jane\n",
+	"\nid,name\r\n1,John\r\n",
+	'id,note\n1,"two\nlines"\n2,x\n',
+])
+def test_scan_file_matches_streaming_helpers(tmp_path: Path, content: str):
+	"""Verifies the single-pass scan agrees with the streaming checksum and csv.reader count."""
+	path = tmp_path / "sample.csv"
+	path.write_bytes(content.encode("utf-8"))
+	meta = {"delimiter": ",", "has_header": True}
+
+	sha, rows, size = scan_file(path, "csv", meta)
+
+	assert sha == compute_sha256(path)
+	assert rows == count_rows_by_format(path, "csv", meta)
+	assert size == path.stat().st_size
+
+
+def test_count_rows_flat_csv_uses_newline_scan(tmp_path: Path):
+	"""Verifies the mmap newline count matches csv.reader for files without quoted multi-line fields."""
+	path = tmp_path / "flat.txt"
+	path.write_text("id|name\n1|John\n\n2|Jane\r\n3|Bob", encoding="utf-8")
+	meta = {"delimiter": "|", "has_header": True}
+
+	fast = count_rows_by_format(path, "txt", {**meta, "quoted_multiline": False})
+
+	assert fast == count_rows_by_format(path, "txt", meta) == 3
+
+
+def test_manifest_reuses_cached_checksums(tmp_path: Path, monkeypatch):
+	"""Verifies unchanged inputs are not re-hashed on the next run."""
+	_create_mock_files(tmp_path / "input")
+	first = json.loads(build_staging_manifest(tmp_path, generate_load_run_id()).read_text(encoding="utf-8"))
+	assert (tmp_path / "output" / ".hash_cache.json").exists()
+
+	def _fail(*args, **kwargs):
+		raise AssertionError("unchanged input was re-hashed")
+
+	monkeypatch.setattr(stage0_manifest, "scan_file", _fail)
+	monkeypatch.setattr(stage0_manifest, "compute_sha256", _fail)
+	second = json.loads(build_staging_manifest(tmp_path, generate_load_run_id()).read_text(encoding="utf-8"))
+
+	for before, after in zip(first["files"], second["files"]):
+		assert (before["sha256"], before["row_count_read"]) == (after["sha256"], after["row_count_read"])
+
+
+def test_count_rows_xlsx_readers_agree(tmp_path: Path, monkeypatch):
+	"""Verifies the calamine path (when installed) and the openpyxl fallback count the same rows."""
+	from openpyxl import Workbook
+
+	path = tmp_path / "dental_provider.xlsx"
+	wb = Workbook()
+	ws = wb.active
+	ws.title = "eligibility"
+	for row in (["id", "name"], [1, "John"], [None, " "], [2, "Jane"]):
+		ws.append(row)
+	wb.save(path)
+
+	fast = stage0_manifest.count_rows_xlsx(path, "eligibility")
+	monkeypatch.setattr(stage0_manifest, "CalamineWorkbook", None)
+
+	assert fast == stage0_manifest.count_rows_xlsx(path, "eligibility") == 2
+
+
+@pytest.mark.parametrize("content", [
+	'{"id": 1}\n\n  \n{"id": 2}',
+	'{"id": 1}\r\n\t\r\n{"id": 2}\r\n',
+	'{"id": 1}\r{"id": 2}\r',
+	'{"id": 1}\n\x85\u2028\n\x1c\u3000\xa0\n{"id": 2}\n',
+])
+def test_count_rows_jsonl_skips_blank_lines(tmp_path: Path, content: str):
+	"""Verifies JSONL rows are counted per non-blank line (as str.strip() sees it) regardless of line endings."""
+	path = tmp_path / "medical_provider_c.jsonl"
+	path.write_bytes(content.encode("utf-8"))
+
+	assert count_rows_by_format(path, "jsonl", {}) == 2
+	assert scan_file(path, "jsonl", {})[1] == 2
+
+
+def test_count_rows_xlsx_falls_back_to_active_sheet(tmp_path: Path, monkeypatch):
+	"""Verifies both readers count the active sheet (not the first one) when the sheet name does not match."""
+	from openpyxl import Workbook
+
+	path = tmp_path / "dental_provider.xlsx"
+	wb = Workbook()
+	wb.active.append(["notes"])
+	ws = wb.create_sheet("eligibility")
+	for row in (["id", "name"], [1, "John"], [2, "Jane"], [3, "Jim"]):
+		ws.append(row)
+	wb.active = ws
+	wb.save(path)
+
+	fast = stage0_manifest.count_rows_xlsx(path, "missing_sheet")
+	monkeypatch.setattr(stage0_manifest, "CalamineWorkbook", None)
+
+	assert fast == stage0_manifest.count_rows_xlsx(path, "missing_sheet") == 3
+
+
+def test_count_rows_jsonl_not_slower_than_line_loop(tmp_path: Path):
+	"""Verifies the mmap JSONL counter keeps up with the text-mode line loop it replaced, at a realistic size."""
+	n_rows = 50_000
+	path = tmp_path / "medical_provider_c.jsonl"
+	line = '{"member_id": "M0001", "name": {"first": "José", "last": "Núñez"}, "dob": {"year": 1990, "month": 5}}\n'
+	path.write_text(line * n_rows + "\n \u3000\n", encoding="utf-8")
+
+	def line_loop():
+		with path.open("r", encoding="utf-8") as f:
+			return sum(1 for line in f if line.strip())
+
+	assert count_rows_jsonl(path) == line_loop() == n_rows
+	assert _best_time(lambda: count_rows_jsonl(path)) <= 1.2 * _best_time(line_loop)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_scan_file_not_slower_than_separate_passes(tmp_path: Path, fmt: str):
+	"""Verifies the fused hash-and-count pass keeps up with hashing plus the original line counters."""
+	n_rows = 50_000
+	path = tmp_path / f"input.{fmt}"
+	if fmt == "csv":
+		path.write_text("id,first_name,last_name,dob\n" + "1001,José,Núñez,05/07/1990\n" * n_rows, encoding="utf-8")
+		meta = {"delimiter": ",", "has_header": True, "quoted_multiline": False}
+
+		def original_count():
+			return stage0_manifest.count_rows_csv_like(path, ",", has_header=True, quoted_multiline=True)
+	else:
+		path.write_text('{"member_id": "M0001", "name": {"first": "José"}}\n' * n_rows, encoding="utf-8")
+		meta = {}
+
+		def original_count():
+			with path.open("r", encoding="utf-8") as f:
+				return sum(1 for line in f if line.strip())
+
+	assert scan_file(path, fmt, meta)[1] == original_count() == n_rows
+	fused = _best_time(lambda: scan_file(path, fmt, meta))
+	separate = _best_time(lambda: (compute_sha256(path), original_count()))
+	assert fused <= 1.2 * separate
@@ -4,13 +4,21 @@ import yaml
 import pytest
 from pathlib import Path
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 # Ensure the src directory is in the path so we can import our modules
 root_path = Path(__file__).resolve().parent.parent
 sys.path.append(str(root_path / "src"))
 
 from pipeline.stage0_init_db import init_db
-from pipeline.stage1_ingest_raw import ingest_stage1_hybrid
+from pipeline import stage1_ingest_raw
+from pipeline.stage1_ingest_raw import (
+	INSERT_CHUNK_ROWS,
+	generate_row_hash,
+	generate_row_hashes,
+	ingest_stage1_hybrid,
+	transform_medical_c,
+)
 
 
 def _setup_test_environment(root: Path):
@@ -106,4 +114,129 @@ def test_ingest_stage1_skips_missing_files(tmp_path: Path):
 	counts = ingest_stage1_hybrid(tmp_path, "run_1", tmp_path / "mappings")
 
 	# Assert
-	assert counts == {}
\ No newline at end of file
+	assert counts == {}
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_ingest_stage1_skips_unreadable_file(tmp_path: Path, monkeypatch, parallel: bool):
+	"""Ensures a vendor file that cannot be parsed is logged and skipped, on both the in-process and pool paths."""
+	_setup_test_environment(tmp_path)
+	dental_mapping = {
+		"source_vendor": "dental",
+		"plan_type": "dental",
+		"provider": "provider_d",
+		"file_format": "xlsx",
+		"sheet_name": "eligibility",
+		"column_mapping": {}
+	}
+	with open(tmp_path / "mappings" / "dental.yaml", "w") as f:
+		yaml.dump(dental_mapping, f)
+	(tmp_path / "input" / "dental_provider.xlsx").write_bytes(b"not a zip archive")
+	init_db(tmp_path)
+
+	if parallel:
+		monkeypatch.setattr(stage1_ingest_raw, "PARALLEL_INGEST_MIN_BYTES", 1)
+		monkeypatch.setattr(stage1_ingest_raw, "PARALLEL_INGEST_MAX_WORKERS", 2)
+	counts = ingest_stage1_hybrid(tmp_path, "corrupt_run", tmp_path / "mappings")
+
+	assert counts == {"medical_a": 2}
+
+
+def test_ingest_stage1_failure_raises_original_error_and_rolls_back(tmp_path: Path):
+	"""Ensures a broken vendor mapping surfaces its own error and leaves no partial load behind."""
+	_setup_test_environment(tmp_path)
+	mapping = yaml.safe_load((tmp_path / "mappings" / "medical_a.yaml").read_text())
+	del mapping["plan_type"]
+	with open(tmp_path / "mappings" / "medical_a.yaml", "w") as f:
+		yaml.dump(mapping, f)
+	init_db(tmp_path)
+
+	with pytest.raises(KeyError, match="plan_type"):
+		ingest_stage1_hybrid(tmp_path, "broken_run", tmp_path / "mappings")
+
+	conn = sqlite3.connect(tmp_path / "output" / "warehouse.db")
+	staged = conn.execute("SELECT COUNT(*) FROM raw_staging").fetchone()[0]
+	conn.close()
+	assert staged == 0
+
+
+def test_generate_row_hashes_matches_per_row_hash():
+	"""Verifies the frame-level hashes equal the original per-row Series hashing."""
+	df = pd.DataFrame({
+		"id": [1, 2],
+		"name": ["Alice", None],
+		"score": [1.5, float("nan")],
+		"plan": [{"tier": "gold", "plan_id": "P1"}, None],
+	})
+
+	expected = [generate_row_hash(row.to_dict()) for _, row in df.iterrows()]
+
+	assert generate_row_hashes(df) == expected
+
+
+def test_ingest_stage1_writes_full_chunks_and_tail(tmp_path: Path):
+	"""Verifies rows spanning several multi-row INSERT chunks plus a tail all land in order."""
+	_setup_test_environment(tmp_path)
+	n_rows = 2 * INSERT_CHUNK_ROWS + 7
+	pd.DataFrame({"first_nm": [f"name{i}" for i in range(n_rows)]}).to_csv(
+		tmp_path / "input" / "medical_provider_a.csv", index=False
+	)
+	init_db(tmp_path)
+
+	counts = ingest_stage1_hybrid(tmp_path, "chunk_run", tmp_path / "mappings")
+
+	assert counts == {"medical_a": n_rows}
+	conn = sqlite3.connect(tmp_path / "output" / "warehouse.db")
+	staged = conn.execute("SELECT source_row, first_name_raw FROM raw_staging ORDER BY source_row").fetchall()
+	conn.close()
+	assert staged == [(i + 1, f"name{i}") for i in range(n_rows)]
+
+
+def test_transform_medical_c_assembles_padded_dob():
+	"""Verifies split DOB parts are zero-padded, invalid parts are kept raw, and gaps stay missing."""
+	df = pd.DataFrame({"dob_year": [2016, 1990, 2001], "dob_month": [5, 13, None], "dob_day": [7, 40, 2]}, dtype=object)
+
+	dob_raw = transform_medical_c(df)["dob_raw"]
+
+	assert dob_raw.iloc[0] == "2016-05-07"
+	assert dob_raw.iloc[1] == "1990-13-40"
+	assert pd.isna(dob_raw.iloc[2])
+
+
+def test_ingest_stage1_process_pool_matches_sequential(tmp_path: Path, monkeypatch):
+	"""Verifies the ProcessPoolExecutor path stages the same rows as the sequential one."""
+	_setup_test_environment(tmp_path)
+	# A second vendor file so the pool gets more than one worker
+	vision_mapping = {
+		"source_vendor": "vision",
+		"plan_type": "vision",
+		"provider": "provider_v",
+		"file_format": "csv",
+		"column_mapping": {"first_nm": "first_name_raw"}
+	}
+	with open(tmp_path / "mappings" / "vision.yaml", "w") as f:
+		yaml.dump(vision_mapping, f)
+	pd.DataFrame({"first_nm": ["Carol", "Dan", "Eve"]}).to_csv(tmp_path / "input" / "vision_provider.csv", index=False)
+	init_db(tmp_path)
+	ingest_stage1_hybrid(tmp_path, "seq_run", tmp_path / "mappings")
+
+	pools = []
+
+	class RecordingPool(ProcessPoolExecutor):
+		def __init__(self, *args, **kwargs):
+			super().__init__(*args, **kwargs)
+			pools.append(self)
+
+	monkeypatch.setattr(stage1_ingest_raw, "PARALLEL_INGEST_MIN_BYTES", 1)
+	monkeypatch.setattr(stage1_ingest_raw, "PARALLEL_INGEST_MAX_WORKERS", 2)
+	monkeypatch.setattr(stage1_ingest_raw, "ProcessPoolExecutor", RecordingPool)
+	counts = ingest_stage1_hybrid(tmp_path, "pool_run", tmp_path / "mappings")
+
+	assert len(pools) == 1
+	assert counts == {"medical_a": 2, "vision": 3}
+	conn = sqlite3.connect(tmp_path / "output" / "warehouse.db")
+	query = "SELECT source_vendor, source_row, first_name_raw, record_hash_raw FROM raw_staging WHERE load_run_id = ? ORDER BY source_vendor, source_row"
+	seq_rows = conn.execute(query, ("seq_run",)).fetchall()
+	pool_rows = conn.execute(query, ("pool_run",)).fetchall()
+	conn.close()
+	assert pool_rows == seq_rows
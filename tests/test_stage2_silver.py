@@ -5,6 +5,11 @@ import yaml
 from datetime import datetime
 from pathlib import Path
 
+from pipeline import stage2_clean_silver
+from pipeline.stage0_init_db import init_db
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
 
 def load_normalization_maps(root: Path) -> dict:
 	"""Loads the relationship normalization map from the YAML file."""
@@ -50,4 +55,86 @@ def run_stage2_cleaning(root: Path, load_run_id: str) -> int:
 		df.to_sql('silver_members', conn, if_exists='append', index=False)
 		return len(df)
 	finally:
-		conn.close()
\ No newline at end of file
+		conn.close()
+
+# --- Tests for the pipeline's Stage 2 (SQL INSERT ... SELECT) ---
+
+
+def _setup_stage2_environment(root: Path):
+	"""
+	Creates the warehouse from the real DDL scripts, a small normalization
+	config, and a few raw_staging rows for one load run.
+	"""
+	(root / "sql").mkdir(parents=True, exist_ok=True)
+	for ddl_path in (REPO_ROOT / "sql").glob("*.sql"):
+		(root / "sql" / ddl_path.name).write_text(ddl_path.read_text(encoding="utf-8"), encoding="utf-8")
+
+	(root / "mappings").mkdir(parents=True, exist_ok=True)
+	config = {
+		"relationship_mappings": {"medical_provider_a": {"emp": "employee", "sps": "spouse"}},
+		"date_formats": {"medical_provider_a": "%m/%d/%Y"},
+	}
+	with open(root / "mappings" / "relationship_normalization.yaml", "w") as f:
+		yaml.dump(config, f)
+
+	db_path = init_db(root)
+	conn = sqlite3.connect(db_path)
+	rows = [
+		("medical_provider_a", 1, "O'Brien ", "12/04/1963", " EMP"),
+		("medical_provider_a", 2, "Anne-Marie", "02/30/2019", "XYZ"),
+		("vision_provider", 1, "Bob", "04-Dec-1963", "S"),
+	]
+	conn.executemany(
+		"""INSERT INTO raw_staging (source_vendor, source_file, source_row, load_run_id, ingested_at,
+		   record_hash_raw, first_name_raw, last_name_raw, dob_raw, relationship_raw, plan_type, provider)
+		   VALUES (?, 'f.csv', ?, 'run_1', 'now', 'hash', ?, 'Smith', ?, ?, 'medical', 'p')""",
+		rows,
+	)
+	conn.commit()
+	conn.close()
+	return db_path
+
+
+def test_stage2_normalizes_into_silver(tmp_path: Path):
+	"""Verifies names, vendor-specific DOB formats and relationship maps are applied in SQL."""
+	db_path = _setup_stage2_environment(tmp_path)
+
+	# Act
+	count = stage2_clean_silver.run_stage2_cleaning(tmp_path, "run_1")
+
+	# Assert
+	assert count == 3
+	conn = sqlite3.connect(db_path)
+	result = {
+		(vendor, row): (first, dob, rel)
+		for vendor, row, first, dob, rel in conn.execute(
+			"SELECT source_vendor, source_row, first_name_norm, dob_norm, relationship_norm FROM silver_members"
+		)
+	}
+	conn.close()
+
+	assert result[("medical_provider_a", 1)] == ("obrien", "1963-12-04", "employee")
+	# Invalid calendar date becomes NULL; unmapped relationship falls back to OTHER
+	assert result[("medical_provider_a", 2)] == ("annemarie", None, "OTHER")
+	# Vendor without a configured date format keeps a NULL dob_norm
+	assert result[("vision_provider", 1)] == ("bob", None, "OTHER")
+
+
+def test_stage2_returns_zero_for_unknown_run(tmp_path: Path):
+	"""Ensures Stage 2 writes nothing when the load run has no raw rows."""
+	_setup_stage2_environment(tmp_path)
+
+	assert stage2_clean_silver.run_stage2_cleaning(tmp_path, "missing_run") == 0
+
+
+def test_stage2_rerun_for_same_run_is_idempotent(tmp_path: Path):
+	"""Ensures re-running Stage 2 for a load run updates Silver rows instead of failing on the PK."""
+	db_path = _setup_stage2_environment(tmp_path)
+
+	stage2_clean_silver.run_stage2_cleaning(tmp_path, "run_1")
+	count = stage2_clean_silver.run_stage2_cleaning(tmp_path, "run_1")
+
+	assert count == 3
+	conn = sqlite3.connect(db_path)
+	assert conn.execute("SELECT COUNT(*) FROM silver_members").fetchone()[0] == 3
+	conn.close()